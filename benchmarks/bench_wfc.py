@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+
+# wavefunctioncollapse
+# Copyright (C) 2023 Christian Henkel
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmarks of the wave function collapse solver.
+
+Measures the time of creating the solver and of generate(), the peak memory
+and the time of graphics(), for several tilesets and grid sizes. Every solver
+is created cold, without the caches filled by earlier ones. Counting memory
+allocations is out of scope, tracemalloc only sees the blocks that are alive.
+Results are written as JSON, which can serve as a baseline for later runs:
+
+    python benchmarks/bench_wfc.py --output baseline.json
+    python benchmarks/bench_wfc.py --compare baseline.json --threshold 0.2
+"""
+
+import argparse
+import itertools
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from wavefunctioncollapse.demo import example_boxes, example_paths
+from wavefunctioncollapse.tileset import Tile
+from wavefunctioncollapse import tileset as tileset_module
+from wavefunctioncollapse import topology as topology_module
+from wavefunctioncollapse import wfc as wfc_module
+from wavefunctioncollapse.wfc import WaveFuctionCollapse
+
+
+class SyntheticTile(Tile):
+    def __hash__(self) -> int:
+        return hash(self.id)
+
+    @property
+    def id(self):
+        return self.name
+
+
+def synthetic_tiles(n_labels):
+    """Return a tileset with a tile for every combination of n_labels edge labels.
+
+    Tiles fit next to each other if their touching edges have the same label.
+    As all combinations exist, every grid can be solved."""
+    edges = list(itertools.product(range(n_labels), repeat=4))
+
+    def names(i_edge, label):
+        return [str(i) for i, edge in enumerate(edges) if edge[i_edge] == label]
+
+    return [
+        SyntheticTile(str(i), '#',
+                      neig_up=names(1, up), neig_dn=names(0, down),
+                      neig_lt=names(3, left), neig_rt=names(2, right))
+        for i, (up, down, left, right) in enumerate(edges)]
+
+
+TILESETS = {
+    'boxes': example_boxes.get_tiles,
+    'paths': example_paths.get_tiles,
+    'synthetic-81': lambda: synthetic_tiles(3),
+    'synthetic-256': lambda: synthetic_tiles(4),
+}
+
+# Tilesets that can be rendered by graphics().
+GRAPHICS_TILESETS = {'paths'}
+
+
+def _clear_cache():
+    """Forget the cached rules, neighbours and initial states, so that every
+    solver starts cold."""
+    # pylint: disable=protected-access
+    tileset_module._compile_rules.cache_clear()
+    tileset_module.minimize_tileset.cache_clear()
+    topology_module._neighbour_table.cache_clear()
+    wfc_module._initial_states.clear()
+
+
+def bench_generate(tiles, size, seed):
+    """Return the time to create the solver and the time to generate a grid."""
+    _clear_cache()
+    start = time.perf_counter()
+    wfc = WaveFuctionCollapse(tiles, (size, size), seed=seed)
+    created = time.perf_counter()
+    wfc.generate()
+    return created - start, time.perf_counter() - created, wfc
+
+
+def bench_memory(tiles, size, seed):
+    """Return the peak memory of creating the solver and generating a grid."""
+    _clear_cache()
+    tracemalloc.start()
+    wfc = WaveFuctionCollapse(tiles, (size, size), seed=seed)
+    wfc.generate()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def bench_graphics(wfc):
+    """Return the time to render the whole grid."""
+    start = time.perf_counter()
+    wfc.graphics()
+    return time.perf_counter() - start
+
+
+def run(tilesets, sizes, repeat, memory, graphics_max_size):
+    results = []
+    for name in tilesets:
+        tiles = TILESETS[name]()
+        for size in sizes:
+            create_times, times = [], []
+            for seed in range(repeat):
+                create_time, duration, wfc = bench_generate(tiles, size, seed)
+                create_times.append(create_time)
+                times.append(duration)
+            result = {'tileset': name, 'size': size, 'create': min(create_times),
+                      'generate': min(times)}
+            if memory:
+                result['peak_memory'] = bench_memory(tiles, size, 0)
+            if name in GRAPHICS_TILESETS and size <= graphics_max_size:
+                result['graphics'] = bench_graphics(wfc)
+            print(json.dumps(result), file=sys.stderr)
+            results.append(result)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Return the measurements that got slower than the baseline by more than threshold."""
+    old = {(r['tileset'], r['size']): r for r in baseline['results']}
+    slower = []
+    for result in results:
+        old_result = old.get((result['tileset'], result['size']))
+        if old_result is None:
+            continue
+        for key in ('create', 'generate', 'graphics', 'peak_memory'):
+            if key in result and key in old_result and (
+                    result[key] > old_result[key] * (1 + threshold)):
+                slower.append((result['tileset'], result['size'], key,
+                               old_result[key], result[key]))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tilesets', nargs='+', default=list(TILESETS),
+                        choices=list(TILESETS))
+    parser.add_argument('--sizes', nargs='+', type=int,
+                        default=[16, 32, 64, 128, 256, 512, 1024],
+                        help="Widths of the square grids.")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="Runs per measurement, the fastest counts.")
+    parser.add_argument('--no-memory', action='store_true',
+                        help="Skip the memory measurement, which runs generate() again.")
+    parser.add_argument('--graphics-max-size', type=int, default=64,
+                        help="Largest grid to time graphics() for.")
+    parser.add_argument('--output', help="Write the results to this JSON file.")
+    parser.add_argument('--compare', help="JSON file of an earlier run to compare to.")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="Relative slowdown that is reported when comparing.")
+    args = parser.parse_args()
+
+    results = run(args.tilesets, args.sizes, args.repeat, not args.no_memory,
+                  args.graphics_max_size)
+    report = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        slower = compare(results, baseline, args.threshold)
+        for tileset, size, key, old, new in slower:
+            print(f"SLOWER {tileset} {size}x{size} {key}: {old:.4g} -> {new:.4g}",
+                  file=sys.stderr)
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+# wavefunctioncollapse
+# Copyright (C) 2023 Christian Henkel
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import queue
+import threading
+from typing import Callable, Optional
+
+import numpy as np
+
+# Put in the queue to stop the background thread.
+_CLOSE = object()
+
+
+class FrameSink():
+    """Hands frames to a write function that runs on a background thread.
+
+    Frames pass through a bounded queue. If the queue is full, frames are
+    dropped instead of waiting for the writer, unless block is set, so the
+    caller is not slowed down by encoding.
+    """
+
+    def __init__(self, write_frame: Callable[[np.ndarray], None],
+                 close: Optional[Callable[[], None]] = None,
+                 maxsize=16, every=1, block=False) -> None:
+        """Create a sink and start its thread.
+
+        Args:
+            write_frame (Callable[[np.ndarray], None]): Writes one RGB frame.
+            close (Optional[Callable[[], None]]): Called after the last frame.
+            maxsize (int): How many frames can wait to be written.
+            every (int): Only every n-th frame that is put is written.
+            block (bool): Wait for the writer when the queue is full instead of
+                dropping the frame.
+        """
+        self._write_frame = write_frame
+        self._close = close
+        self.every = every
+        self.block = block
+        # Number of frames put, and of those dropped because the queue was full.
+        self.n_frames = 0
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize)
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            while True:
+                frame = self._queue.get()
+                if frame is _CLOSE:
+                    break
+                self._write_frame(frame)
+        except Exception as e:  # pylint: disable=broad-except
+            # reported by close(), keep taking frames so put() never hangs
+            self._error = e
+            while self._queue.get() is not _CLOSE:
+                pass
+        if self._close is not None:
+            try:
+                self._close()
+            except Exception as e:  # pylint: disable=broad-except
+                if self._error is None:
+                    self._error = e
+
+    def put(self, frame) -> bool:
+        """Queue a frame for writing.
+
+        The frame must not be changed afterwards, pass a copy if needed.
+        Returns whether the frame was queued."""
+        self.n_frames += 1
+        if (self.n_frames - 1) % self.every:
+            return False
+        try:
+            self._queue.put(frame, block=self.block)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def close(self):
+        """Write all queued frames and stop the thread."""
+        if self._thread.is_alive():
+            self._queue.put(_CLOSE)
+            self._thread.join()
+        if self._error is not None:
+            raise RuntimeError("Writing frames failed") from self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def writer_sink(path, maxsize=16, every=1, block=False, **kwargs) -> FrameSink:
+    """Return a sink that writes frames to a GIF or video file with imageio.
+
+    The format is chosen by imageio from the extension of path, further
+    keyword arguments are passed to `imageio.get_writer`."""
+    import imageio  # pylint: disable=import-outside-toplevel
+    writer = imageio.get_writer(path, mode='I', **kwargs)
+    return FrameSink(writer.append_data, writer.close,
+                     maxsize=maxsize, every=every, block=block)
@@ -0,0 +1,232 @@
+# wavefunctioncollapse
+# Copyright (C) 2023 Christian Henkel
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Backends are part of the solver and work on its internal state.
+# pylint: disable=protected-access
+
+import abc
+from collections import deque
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+
+
+class Backend(abc.ABC):
+    """Propagates the constraints of the tileset for `WaveFuctionCollapse`.
+
+    The solver owns the wave and removes tiles with its `_ban`, which tells the
+    backend through `ban`. The backend finds the tiles that lost all support
+    in `propagate` and bans them in turn. Undoing bans is reported by `restore`.
+    """
+
+    @abc.abstractmethod
+    def reset(self, wfc, state: Optional[Dict[str, np.ndarray]] = None) -> None:
+        """Start propagating for the solver wfc.
+
+        Without state, all tiles are possible and cells that must be checked
+        before the first `propagate` are queued. Otherwise the wave of the solver
+        is propagated already and state is what `get_state` returned for it."""
+
+    def get_state(self) -> Dict[str, np.ndarray]:
+        """Return the arrays needed to continue propagating for the current wave."""
+        return {}
+
+    @abc.abstractmethod
+    def ban(self, cell: int, i_tiles: np.ndarray) -> None:
+        """The tiles i_tiles were removed from the possible tiles of the cell."""
+
+    def restore(self, cell: int, i_tiles: np.ndarray) -> None:
+        """The tiles i_tiles are possible again in the cell."""
+
+    @abc.abstractmethod
+    def check(self, cells: np.ndarray) -> None:
+        """Queue cells whose tiles may lack support, e.g. after tiles were restored."""
+
+    @abc.abstractmethod
+    def propagate(self) -> bool:
+        """Ban tiles without support until there are none left.
+
+        Returns False if a cell ran out of possible tiles."""
+
+    @abc.abstractmethod
+    def clear(self) -> None:
+        """Forget the cells that are waiting to be propagated."""
+
+
+class NumpyBackend(Backend):
+    """Propagation by support counts (AC-4), kept in numpy arrays.
+
+    For every cell, direction and tile, the number of tiles at the neighbour in
+    that direction that allow the tile is kept. Bans decrement these counts right
+    away and only cells whose counts reach 0 are visited, so the work is
+    proportional to the number of removed tiles."""
+
+    def __init__(self) -> None:
+        self._wfc = None
+        self._support = np.zeros((0, 0, 0), dtype=np.int16)
+        self._queue: deque = deque()
+        self._queued = np.zeros(0, dtype=bool)
+
+    def reset(self, wfc, state=None) -> None:
+        self._wfc = wfc
+        self._queue.clear()
+        self._queued = np.zeros(len(wfc._wave_flat), dtype=bool)
+        if state is not None:
+            self._support = state['support']
+            return
+        self._support = self._get_initial_support()
+        self._enqueue(np.flatnonzero((self._support == 0).any(axis=1).any(axis=1)))
+
+    def get_state(self):
+        return {'support': self._support}
+
+    def _get_initial_support(self):
+        """Return how many tiles of the neighbour in each direction allow each tile.
+
+        The support of tile t in cell c and direction d is the number of tiles still
+        possible at the neighbour of c in direction d that can be placed next to t.
+        Neighbours outside the grid do not constrain a cell, so they count as one
+        support that is never removed."""
+        neighbours = self._wfc._neighbours
+        compatible = self._wfc._compatible
+        n_tiles = compatible.shape[1]
+        dtype = np.int16 if n_tiles < np.iinfo(np.int16).max else np.int32
+        support = np.empty(neighbours.shape + (n_tiles,), dtype=dtype)
+        for i_neig in range(neighbours.shape[1]):
+            support[:, i_neig] = compatible[i_neig].sum(axis=1, dtype=dtype)
+            support[neighbours[:, i_neig] < 0, i_neig] = 1
+        return support
+
+    def ban(self, cell, i_tiles):
+        wfc = self._wfc
+        for i_neig, i_opposite in enumerate(wfc._opposite):
+            cell_neig = wfc._neighbours[cell, i_neig]
+            if cell_neig < 0:
+                continue
+            support = self._support[cell_neig, i_opposite]
+            removed = wfc._compatible[i_neig, i_tiles].sum(axis=0, dtype=support.dtype)
+            support -= removed
+            if (wfc._wave_flat[cell_neig] & (support == 0) & (removed > 0)).any():
+                self._enqueue([cell_neig])
+
+    def restore(self, cell, i_tiles):
+        wfc = self._wfc
+        for i_neig, i_opposite in enumerate(wfc._opposite):
+            cell_neig = wfc._neighbours[cell, i_neig]
+            if cell_neig >= 0:
+                support = self._support[cell_neig, i_opposite]
+                support += wfc._compatible[i_neig, i_tiles].sum(
+                    axis=0, dtype=support.dtype)
+
+    def check(self, cells):
+        self._enqueue(cells)
+
+    def _enqueue(self, cells):
+        for cell in cells:
+            if not self._queued[cell]:
+                self._queued[cell] = True
+                self._queue.append(cell)
+
+    def propagate(self):
+        wfc = self._wfc
+        while self._queue:
+            cell = self._queue.popleft()
+            self._queued[cell] = False
+            if wfc.stats is not None:
+                wfc.stats.propagation_visits += 1
+            unsupported = np.flatnonzero(
+                wfc._wave_flat[cell] & (self._support[cell] == 0).any(axis=0))
+            wfc._ban(cell, unsupported)
+            if wfc._counts_flat[cell] == 0:
+                self.clear()
+                return False
+        return True
+
+    def clear(self):
+        for cell in self._queue:
+            self._queued[cell] = False
+        self._queue.clear()
+
+
+class ReferenceBackend(Backend):
+    """Straightforward propagation with sets of tiles (AC-3).
+
+    Whenever a cell lost tiles, the possible tiles of its neighbours are
+    intersected with the tiles allowed next to the remaining ones. It keeps no
+    state besides the queue, which makes it slow but easy to check, and a
+    reference for other backends."""
+
+    def __init__(self) -> None:
+        self._wfc = None
+        # Per direction and tile, the tiles allowed in that direction.
+        self._allowed: List[List[Set[int]]] = []
+        self._queue: deque = deque()
+        self._queued: Set[int] = set()
+
+    def reset(self, wfc, state=None) -> None:
+        self._wfc = wfc
+        self._allowed = [[set(np.flatnonzero(row).tolist()) for row in compatible]
+                         for compatible in wfc._compatible]
+        # every cell may rule out tiles of its neighbours
+        self._queue = deque(range(len(wfc._wave_flat)) if state is None else ())
+        self._queued = set(self._queue)
+
+    def ban(self, cell, i_tiles):
+        self._enqueue(cell)
+
+    def check(self, cells):
+        # tiles of a cell are ruled out when its neighbours are revised
+        for cell in cells:
+            for cell_neig in self._wfc._neighbours[cell]:
+                if cell_neig >= 0:
+                    self._enqueue(cell_neig)
+
+    def _enqueue(self, cell):
+        if cell not in self._queued:
+            self._queued.add(cell)
+            self._queue.append(cell)
+
+    def propagate(self):
+        wfc = self._wfc
+        while self._queue:
+            cell = self._queue.popleft()
+            self._queued.discard(cell)
+            if wfc.stats is not None:
+                wfc.stats.propagation_visits += 1
+            possible = np.flatnonzero(wfc._wave_flat[cell]).tolist()
+            for i_neig, cell_neig in enumerate(wfc._neighbours[cell]):
+                if cell_neig < 0:
+                    continue
+                allowed = set().union(*(self._allowed[i_neig][i_tile]
+                                        for i_tile in possible))
+                banned = [i_tile for i_tile in np.flatnonzero(wfc._wave_flat[cell_neig])
+                          if i_tile not in allowed]
+                wfc._ban(cell_neig, np.array(banned, dtype=np.intp))
+                if wfc._counts_flat[cell_neig] == 0:
+                    self.clear()
+                    return False
+        return True
+
+    def clear(self):
+        self._queue.clear()
+        self._queued.clear()
+
+
+# The backends that can be selected by name.
+BACKENDS = {
+    'numpy': NumpyBackend,
+    'reference': ReferenceBackend,
+}
@@ -0,0 +1,149 @@
+# wavefunctioncollapse
+# Copyright (C) 2023 Christian Henkel
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from typing import Tuple
+
+import numpy as np
+
+from wavefunctioncollapse.tileset import compile_tileset
+from wavefunctioncollapse.wfc import get_neighbours, spawn_seeds
+
+
+class _BatchWave():
+    """The waves of many grids of the same size and tileset.
+
+    The wave has a leading batch dimension. There is one extra cell at the end
+    of every grid that neighbours outside the grid point to. It does not
+    constrain the cells next to it, as edges are unconstrained in the solver."""
+
+    def __init__(self, compiled, shape, n, tie_breaks) -> None:
+        self.n_cells = shape[0] * shape[1]
+        self.neighbours = get_neighbours(shape)
+        self.neighbours[self.neighbours < 0] = self.n_cells
+        self.compatible = compiled.compatible.astype(np.float32)
+        self.wave = np.ones((n, self.n_cells + 1, len(compiled)), dtype=bool)
+        self.counts = np.full((n, self.n_cells), len(compiled), dtype=np.int32)
+        self.failed = np.zeros(n, dtype=bool)
+        # The cell with the lowest key is fixed next: the number of possible tiles
+        # plus a random number < 1 to break ties, inf where nothing is left to choose.
+        self.tie_breaks = tie_breaks
+        self.keys = self.counts + tie_breaks
+
+    def set_counts(self, i_batch, cells, counts):
+        self.counts[i_batch, cells] = counts
+        self.keys[i_batch, cells] = np.where(
+            counts > 1, counts + self.tie_breaks[i_batch, cells], np.inf)
+
+    def propagate(self, i_batch, cells):
+        """Propagate the constraints from the given cells, whose possible tiles
+        changed, until nothing changes anymore.
+
+        Only the neighbours of changed cells are looked at in each round, for all
+        grids at once."""
+        n_neigs = self.neighbours.shape[1]
+        while len(i_batch):
+            # the neighbours of changed cells may have lost support
+            i_batch = np.repeat(i_batch, n_neigs)
+            cells = self.neighbours[cells].ravel()
+            inside = cells < self.n_cells
+            i_batch, cells = i_batch[inside], cells[inside]
+            allowed = np.ones((len(cells), self.wave.shape[2]), dtype=bool)
+            for i_neig in range(n_neigs):
+                neigs = self.neighbours[cells, i_neig]
+                wave_neig = self.wave[i_batch, neigs]
+                supported = wave_neig.astype(np.float32) @ self.compatible[i_neig].T > 0
+                allowed &= supported | (neigs == self.n_cells)[:, None]
+            before = self.wave[i_batch, cells]
+            after = before & allowed
+            changed = (after != before).any(axis=1)
+            if not changed.any():
+                break
+            # a cell may have been reached from several neighbours
+            _, unique = np.unique(
+                i_batch[changed] * self.n_cells + cells[changed], return_index=True)
+            changed = np.flatnonzero(changed)[unique]
+            i_batch, cells, after = i_batch[changed], cells[changed], after[changed]
+            self.wave[i_batch, cells] = after
+            self.set_counts(i_batch, cells, after.sum(axis=1))
+            # grids with a contradiction are not propagated any further
+            self.fail(i_batch[self.counts[i_batch, cells] == 0])
+            ok = ~self.failed[i_batch]
+            i_batch, cells = i_batch[ok], cells[ok]
+
+    def fail(self, i_batch):
+        self.failed[i_batch] = True
+        self.keys[i_batch] = np.inf
+
+
+def generate_batch(tiles, size, n, seeds=None) -> Tuple[np.ndarray, np.ndarray]:
+    """Generate n independent grids of the same size and tileset at once.
+
+    All grids are solved together, with the wave, the cell selection and the
+    propagation vectorized over a leading batch dimension. This pays off for
+    many small grids. Cells are selected by the fewest possible tiles and tiles
+    by their weights. There is no backtracking: a grid with a contradiction is
+    reported as failed.
+
+    Args:
+        tiles (List[Tile]): The tileset.
+        size (Tuple[int, int]): The width and height of each grid.
+        n (int): The number of grids.
+        seeds (Union[None, int, SeedSequence, Sequence]): Either one seed to derive
+            the seeds of all grids from, or a sequence with a seed per grid.
+            A grid is the same for the same seed, independent of the batch.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The index of the tile in each cell with shape
+            (n, height, width), -1 in failed grids, and whether each grid failed.
+    """
+    compiled = compile_tileset(tiles)
+    shape = (size[1], size[0])
+    n_cells = shape[0] * shape[1]
+
+    # Random numbers are drawn up front per grid so that a grid only depends on
+    # its seed: a random order of the cells to break ties and one number per choice.
+    rngs = [np.random.default_rng(seed) for seed in spawn_seeds(n, seeds)]
+    tie_breaks = np.stack([rng.random(n_cells) for rng in rngs])
+    choices = np.stack([rng.random(n_cells) for rng in rngs])
+    batch = _BatchWave(compiled, shape, n, tie_breaks)
+
+    # tiles that can not be supported by any neighbour are removed first
+    batch.propagate(np.zeros(n_cells, dtype=np.intp), np.arange(n_cells))
+    batch.wave[1:] = batch.wave[0]
+    batch.set_counts(slice(None), slice(None), batch.counts[0])
+    if batch.failed[0]:
+        batch.fail(slice(None))
+
+    for step in range(n_cells):
+        cells = np.argmin(batch.keys, axis=1)
+        i_batch = np.flatnonzero(batch.keys[np.arange(n), cells] < np.inf)
+        if len(i_batch) == 0:
+            break
+        cells = cells[i_batch]
+
+        # choose one of the possible tiles by their weights
+        cumulative = np.cumsum(batch.wave[i_batch, cells] * compiled.weights, axis=1)
+        chosen = choices[i_batch, step] * cumulative[:, -1]
+        i_tiles = np.argmax(cumulative > chosen[:, None], axis=1)
+        batch.wave[i_batch, cells] = False
+        batch.wave[i_batch, cells, i_tiles] = True
+        batch.set_counts(i_batch, cells, np.ones(len(cells), dtype=np.int32))
+        batch.propagate(i_batch, cells)
+
+    dtype = np.int16 if len(compiled) < np.iinfo(np.int16).max else np.int32
+    grids = np.argmax(batch.wave[:, :n_cells], axis=2).astype(dtype)
+    grids[batch.failed] = -1
+    return grids.reshape((n,) + shape), batch.failed
@@ -0,0 +1,117 @@
+# wavefunctioncollapse
+# Copyright (C) 2023 Christian Henkel
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Saving the state of a solver to continue later or elsewhere.
+
+A checkpoint is a directory with one `.npy` file per array of the state and a
+`meta.json` with the tileset hash, the size, the topology, the backend, the
+boundary and the state of the random generator. Arrays are stored raw, so they
+can be memory mapped when loading instead of being read.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from wavefunctioncollapse.backends import BACKENDS
+from wavefunctioncollapse.topology import Grid2D
+from wavefunctioncollapse.wfc import WaveFuctionCollapse
+
+# Version of the layout of a checkpoint.
+FORMAT = 1
+
+
+def _backend_name(wfc):
+    for name, backend_class in BACKENDS.items():
+        if type(wfc._backend) is backend_class:  # pylint: disable=protected-access
+            return name
+    raise ValueError(f"Backend {type(wfc._backend)} can not be saved")  # pylint: disable=protected-access
+
+
+def save_checkpoint(wfc: WaveFuctionCollapse, path) -> None:
+    """Save the state of a solver to the directory path.
+
+    Save between runs of `generate` or from its progress callback. Choices made
+    before can not be undone by backtracking after loading. A solver loaded from
+    a checkpoint may be saved to the same directory.
+
+    Args:
+        wfc (WaveFuctionCollapse): The solver.
+        path (str): The directory, it is created if needed.
+    """
+    os.makedirs(path, exist_ok=True)
+    state = wfc.get_state()
+    # The arrays may be mapped from the files they replace, so every file is
+    # written next to its target first and moved into place at the end.
+    written = []
+    for name, array in state.items():
+        target = os.path.join(path, name + '.npy')
+        with open(target + '.tmp', 'wb') as f:
+            np.save(f, array)
+        written.append(target)
+    meta = {
+        'format': FORMAT,
+        'tileset_hash': wfc.compiled.hash,
+        'size': list(wfc.size),
+        'topology': repr(wfc.topology),
+        'backend': _backend_name(wfc),
+        'boundary': wfc.boundary,
+        'arrays': list(state),
+        'rng': wfc.rng.bit_generator.state,
+    }
+    target = os.path.join(path, 'meta.json')
+    with open(target + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    written.append(target)
+    for target in written:
+        os.replace(target + '.tmp', target)
+
+
+def load_checkpoint(path, tiles, mmap=True, **options) -> WaveFuctionCollapse:
+    """Create a solver that continues from a checkpoint.
+
+    Args:
+        path (str): The directory of the checkpoint.
+        tiles (List[Tile]): The tileset, it must be the one the checkpoint was made with.
+        mmap (bool): Map the arrays into memory copy-on-write instead of reading them.
+            Only the parts of the grid that are used are read then, and changes are
+            not written back to the checkpoint.
+        **options: Further arguments for `WaveFuctionCollapse`, the topology must be
+            the one of the checkpoint.
+
+    Raises:
+        ValueError: If the checkpoint does not fit the tileset or the options.
+    """
+    with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta['format'] != FORMAT:
+        raise ValueError(f"Unknown checkpoint format {meta['format']}")
+    topology = options.get('topology') or Grid2D()
+    if repr(topology) != meta['topology']:
+        raise ValueError(f"Checkpoint was made with {meta['topology']}")
+    for option in ('backend', 'boundary'):
+        options.setdefault(option, meta[option])
+        if options[option] != meta[option]:
+            raise ValueError(f"Checkpoint was made with {option} {meta[option]}")
+    state = {name: np.load(os.path.join(path, name + '.npy'),
+                           mmap_mode='c' if mmap else None)
+             for name in meta['arrays']}
+    wfc = WaveFuctionCollapse(tiles, tuple(meta['size']), state=state, **options)
+    if wfc.compiled.hash != meta['tileset_hash']:
+        raise ValueError("Checkpoint was made with a different tileset")
+    wfc.rng.bit_generator.state = meta['rng']
+    return wfc
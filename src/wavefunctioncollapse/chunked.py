@@ -0,0 +1,133 @@
+# wavefunctioncollapse
+# Copyright (C) 2023 Christian Henkel
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from itertools import count
+from typing import Any, Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from wavefunctioncollapse.tileset import OPPOSITE_IND, Neig
+from wavefunctioncollapse.wfc import WaveFuctionCollapse
+
+# The cells of a chunk that touch its neighbour in each direction.
+_EDGES: Dict[Neig, Tuple[Any, ...]] = {
+    Neig.UP: np.s_[0, :],
+    Neig.DOWN: np.s_[-1, :],
+    Neig.LEFT: np.s_[:, 0],
+    Neig.RIGHT: np.s_[:, -1],
+}
+
+
+def _solve_chunk(tiles, chunk_size, seed, borders, options) -> np.ndarray:
+    """Solve one chunk, given the tiles along the edges of its solved neighbours.
+
+    Args:
+        borders (Dict[Neig, np.ndarray]): For the neighbours in each direction that
+            are solved, the indices of their tiles that touch this chunk.
+
+    Returns:
+        np.ndarray: The index of the tile in each cell of the chunk.
+    """
+    wfc = WaveFuctionCollapse(tiles, chunk_size, seed=seed, **options)
+    allowed = np.ones(wfc.collapsed.shape + (len(tiles),), dtype=bool)
+    for i_neig, neig in enumerate(Neig):
+        if neig in borders:
+            # tiles of our edge must allow the neighbouring tile in direction neig
+            allowed[_EDGES[neig]] &= (
+                wfc.compiled.compatible[OPPOSITE_IND[i_neig]][borders[neig]] > 0)
+    wfc.constrain(allowed)
+    wfc.generate()
+    return wfc.collapsed.copy()
+
+
+class ChunkedWorld():
+    """A world that is generated chunk by chunk.
+
+    Each chunk is solved by its own `WaveFuctionCollapse`, with the edges of the
+    chunks left of and above it as constraints. Only these edges are kept, so
+    the memory needed does not grow with the size of the world.
+    """
+
+    def __init__(self, tiles, chunk_size, seed=None, **options) -> None:
+        """Create a world.
+
+        Args:
+            tiles (List[Tile]): The tileset.
+            chunk_size (Tuple[int, int]): The width and height of each chunk.
+            seed (Union[None, int, SeedSequence]): Seed of the world, each chunk
+                gets its own seed derived from it and the position of the chunk.
+            **options: Further arguments for `WaveFuctionCollapse`.
+        """
+        self.tiles = tiles
+        self.chunk_size = chunk_size
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        self.entropy = seed.entropy
+        self.options = options
+
+    def chunk_seed(self, ix, iy) -> np.random.SeedSequence:
+        """Return the seed of the chunk in row ix and column iy."""
+        return np.random.SeedSequence(self.entropy, spawn_key=(ix, iy))
+
+    def stream(self, width, height=None, executor=None
+               ) -> Iterator[Tuple[Tuple[int, int], np.ndarray]]:
+        """Generate the chunks of a world of width by height chunks.
+
+        Chunks are generated along anti-diagonals: all chunks with the same
+        ix + iy only depend on chunks of the diagonal before, so they can be
+        solved at the same time.
+
+        Args:
+            width (int): Number of chunks per row.
+            height (Optional[int]): Number of rows of chunks, None for no end.
+            executor (Optional[Executor]): Solves the chunks of a diagonal concurrently,
+                e.g. a `concurrent.futures.ProcessPoolExecutor`. Without it, chunks
+                are solved one after another.
+
+        Yields:
+            Tuple[Tuple[int, int], np.ndarray]: The row and column of the chunk and
+                the index of the tile in each of its cells.
+        """
+        # the edges of the last diagonal that the next one is constrained by
+        right_edges: Dict[Tuple[int, int], np.ndarray] = {}
+        bottom_edges: Dict[Tuple[int, int], np.ndarray] = {}
+        for diagonal in count():
+            if height is not None and diagonal > width + height - 2:
+                return
+            first_row = max(0, diagonal - width + 1)
+            last_row = diagonal if height is None else min(diagonal, height - 1)
+            # per chunk its index and the arguments or the future of its solution
+            jobs: List[Tuple[Tuple[int, int], Any]] = []
+            for ix in range(first_row, last_row + 1):
+                iy = diagonal - ix
+                borders = {}
+                if (ix, iy - 1) in right_edges:
+                    borders[Neig.LEFT] = right_edges[(ix, iy - 1)]
+                if (ix - 1, iy) in bottom_edges:
+                    borders[Neig.UP] = bottom_edges[(ix - 1, iy)]
+                args = (self.tiles, self.chunk_size, self.chunk_seed(ix, iy),
+                        borders, self.options)
+                if executor is None:
+                    jobs.append(((ix, iy), args))
+                else:
+                    jobs.append(((ix, iy), executor.submit(_solve_chunk, *args)))
+            right_edges.clear()
+            bottom_edges.clear()
+            for ind, job in jobs:
+                chunk = _solve_chunk(*job) if executor is None else job.result()
+                right_edges[ind] = chunk[_EDGES[Neig.RIGHT]]
+                bottom_edges[ind] = chunk[_EDGES[Neig.DOWN]]
+                yield ind, chunk
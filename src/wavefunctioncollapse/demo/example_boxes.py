@@ -28,8 +28,9 @@ class ConsoleTile(Tile):
         return self.name
 
 
-def main():
-    tiles = [
+def get_tiles():
+    """Return the tileset of boxes."""
+    return [
         ConsoleTile('k', '⚫',
                     neig_dn=['k', 'u'],
                     neig_up=['k', 'd'],
@@ -73,7 +74,9 @@ def main():
                     neig_rt=['u', 'd']),
     ]
 
-    wfc = WaveFuctionCollapse(tiles, (15, 15))
+
+def main():
+    wfc = WaveFuctionCollapse(get_tiles(), (15, 15))
     wfc.generate()
 
     print("done")
@@ -16,25 +16,29 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import sys
 import time
 import os
-import imageio
 
+from wavefunctioncollapse.animation import writer_sink
+from wavefunctioncollapse.symmetry import derive_neighbours, get_variants
 from wavefunctioncollapse.wfc import Tile, WaveFuctionCollapse, Neig
 
-import cv2
 import numpy as np
 import PIL.Image
 from PIL import ImageFont, ImageDraw
 
-sys.setrecursionlimit(16385)
+
+# How many differently jittered images of each tile are drawn at most.
+N_VARIANTS = 8
 
 
 class ConsoleTile(Tile):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, connectors=(), **kwargs):
+        """Create a tile, with paths to the sides in connectors."""
         super().__init__(*args, **kwargs)
+        self.connectors = set(connectors)
         self.res = 60
+        # one image per variant, seeds are mapped to N_VARIANTS variants
         self._graphics = {}
 
     def __hash__(self) -> int:
@@ -45,6 +49,7 @@ class ConsoleTile(Tile):
         return self.name
     
     def graphics(self, seed=None):
+        seed = 0 if seed is None else seed % N_VARIANTS
         if seed not in self._graphics:
             self._graphics[seed] = self.cache_graphics(seed)
         return self._graphics[seed]
@@ -56,27 +61,7 @@ class ConsoleTile(Tile):
         # print("graphics for", self.name)
 
         # based on image, create a clear image, that we want
-        connectors = {n: False for n in Neig}  # where to draw connectors
-        if self.name == '+':
-            connectors = {n: True for n in Neig}
-        elif self.name == '-':
-            connectors[Neig.LEFT] = True
-            connectors[Neig.RIGHT] = True
-        elif self.name == '|':
-            connectors[Neig.UP] = True
-            connectors[Neig.DOWN] = True
-        elif self.name == 'r':
-            connectors[Neig.DOWN] = True
-            connectors[Neig.RIGHT] = True
-        elif self.name == '7':
-            connectors[Neig.DOWN] = True
-            connectors[Neig.LEFT] = True
-        elif self.name == 'J':
-            connectors[Neig.UP] = True
-            connectors[Neig.LEFT] = True
-        elif self.name == 'L':
-            connectors[Neig.UP] = True
-            connectors[Neig.RIGHT] = True
+        connectors = {n: n in self.connectors for n in Neig}  # where to draw connectors
 
         # print("connectors", connectors)
         
@@ -149,94 +134,49 @@ class ConsoleTile(Tile):
         return self.res
 
 
+def _variants(name, visual, symmetry, connectors, names=None, visuals=None):
+    """Return the variants of the tile with paths to the sides in connectors."""
+    edges = {neig: 'path' if neig in connectors else 'empty' for neig in Neig}
+    return get_variants(ConsoleTile(name, visual, connectors=connectors),
+                        symmetry, edges, names or [name], visuals or [visual])
+
+
+def get_tiles():
+    """Return the tileset of paths.
+
+    Only the crossing, the empty tile, the straight path and one corner are
+    drawn, the other tiles are their rotations."""
+    return derive_neighbours(
+        _variants('+', '┼', 'X', tuple(Neig)) +
+        _variants(' ', ' ', 'X', ()) +
+        _variants('|', '│', 'I', (Neig.UP, Neig.DOWN), ['|', '-'], ['│', '─']) +
+        _variants('r', '┌', 'L', (Neig.DOWN, Neig.RIGHT),
+                  ['r', '7', 'J', 'L'], ['┌', '┐', '┘', '└']))
+
+
 def main():
-    tiles = [
-        ConsoleTile(
-            '+', '┼',
-            neig_dn=['+', '|', 'J', 'L'],
-            neig_up=['+', '|', 'r', '7'],
-            neig_lt=['+', '-', 'r', 'L'],
-            neig_rt=['+', '-', '7', 'J']
-        ),
-        ConsoleTile(
-            '-', '─',
-            neig_dn=[' ', '-', 'r', '7'],
-            neig_up=[' ', '-', 'J', 'L'],
-            neig_lt=['+', '-', 'r', 'L'],
-            neig_rt=['+', '-', '7', 'J']
-        ),
-        ConsoleTile(
-            '|', '│',
-            neig_dn=['+', '|', 'J', 'L'],
-            neig_up=['+', '|', 'r', '7'],
-            neig_lt=[' ', '|', 'J', '7'],
-            neig_rt=[' ', '|', 'r', 'L']
-        ),
-        ConsoleTile(
-            ' ', ' ',
-            neig_dn=[' ', '-', 'r', '7'],
-            neig_up=[' ', '-', 'J', 'L'],
-            neig_lt=[' ', '|', 'J', '7'],
-            neig_rt=[' ', '|', 'r', 'L']
-        ),
-        ConsoleTile(
-            'r', '┌',
-            neig_dn=['|', 'J', '+', 'L'],
-            neig_up=[' ', '-', 'J', 'L'],
-            neig_lt=[' ', '|', 'J', '7'],
-            neig_rt=['-', 'J', '+', '7'],
-        ),
-        ConsoleTile(
-            '7', '┐',
-            neig_dn=['|', 'J', '+', 'L'],
-            neig_up=[' ', '-', 'J', 'L'],
-            neig_lt=['-', 'r', '+', 'L'],
-            neig_rt=[' ', '|', 'r', 'L'],
-        ),
-        ConsoleTile(
-            'J', '┘',
-            neig_dn=[' ', '-', 'r', '7'],
-            neig_up=['|', 'r', '+', '7'],
-            neig_lt=['-', 'r', '+', 'L'],
-            neig_rt=[' ', '|', 'r', 'L'],
-        ),
-        ConsoleTile(
-            'L', '└',
-            neig_dn=[' ', '-', 'r', '7'],
-            neig_up=['|', 'r', '+', '7'],
-            neig_lt=[' ', '|', 'J', '7'],
-            neig_rt=['-', '7', '+', 'J'],
-        ),
-    ]
-
-    wfc = WaveFuctionCollapse(tiles, (32, 18))
+    import cv2  # pylint: disable=import-outside-toplevel
+
+    wfc = WaveFuctionCollapse(get_tiles(), (32, 18))
 
     cv2.namedWindow('image', cv2.WND_PROP_FULLSCREEN)
     cv2.setWindowProperty('image',cv2.WND_PROP_FULLSCREEN,cv2.WINDOW_FULLSCREEN)
 
-    # directory for saving the progress images
+    # directory for saving the animation
     IMG_FOLDER = "img"
     if not os.path.exists(IMG_FOLDER):
         os.makedirs(IMG_FOLDER)
-    else:
-        for f in os.listdir(IMG_FOLDER):
-            os.remove(os.path.join(IMG_FOLDER, f))
-
-    def progress_callback(wfc, i, i_max):
-        digits = len(str(i_max))
-        str_i = str(i).zfill(digits)
-        image = wfc.graphics()
-        cv2.imshow("image", np.array(image))
-        # time.sleep(0.1)
-        cv2.imwrite(os.path.join(IMG_FOLDER, f"{str_i}.png"), np.array(image))
-        cv2.waitKey(1)
-
-    wfc.generate(progress_callback)
-
-    with imageio.get_writer(os.path.join(IMG_FOLDER, 'wfc.gif'), mode='I') as writer:
-        for filename in sorted(os.listdir(IMG_FOLDER)):
-            image = imageio.imread(os.path.join(IMG_FOLDER, filename))
-            writer.append_data(image)
+
+    # the frames are encoded to the gif in the background
+    with writer_sink(os.path.join(IMG_FOLDER, 'wfc.gif'), maxsize=64) as sink:
+        def progress_callback(wfc, i, i_max):
+            image = np.array(wfc.graphics())
+            cv2.imshow("image", image)
+            # time.sleep(0.1)
+            sink.put(image)
+            cv2.waitKey(1)
+
+        wfc.generate(progress_callback)
     cv2.waitKey(0)
 
     print("\n\n")
@@ -0,0 +1,118 @@
+# wavefunctioncollapse
+# Copyright (C) 2023 Christian Henkel
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Output of large grids without building Python objects per cell.
+
+The grid is exported as compact array of tile indices, or written row by row
+as text or image, so memory stays flat however large the grid is.
+"""
+
+import contextlib
+from typing import List, Tuple
+
+import numpy as np
+
+from wavefunctioncollapse.render import OverlayCache, variant_of
+
+# Rows of the grid handled at once.
+_ROWS_PER_CHUNK = 256
+
+
+def index_dtype(n_tiles) -> np.dtype:
+    """Return the smallest unsigned type for the indices of n_tiles tiles.
+
+    The largest value of the type is kept free for cells that are not fixed."""
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if n_tiles < np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    raise ValueError(f"Too many tiles: {n_tiles}")
+
+
+def to_array(wfc, path=None) -> Tuple[np.ndarray, List]:
+    """Return the index of the tile of each cell as compact array.
+
+    Args:
+        wfc (WaveFuctionCollapse): The solver.
+        path (Optional[str]): Write the array to this `.npy` file and return it
+            memory mapped, instead of keeping it in memory.
+
+    Returns:
+        Tuple[np.ndarray, List]: The tile indices, with the largest value of the
+            type for cells that are not fixed, and the tile id of each index.
+    """
+    dtype = index_dtype(len(wfc.tiles))
+    mapped = None
+    if path is None:
+        out = np.empty(wfc.collapsed.shape, dtype=dtype)
+    else:
+        out = mapped = np.lib.format.open_memmap(path, mode='w+', dtype=dtype,
+                                                 shape=wfc.collapsed.shape)
+    unfixed = np.iinfo(dtype).max
+    for start in range(0, len(out), _ROWS_PER_CHUNK):
+        rows = wfc.collapsed[start:start + _ROWS_PER_CHUNK]
+        out[start:start + _ROWS_PER_CHUNK] = np.where(rows < 0, unfixed, rows)
+    if mapped is not None:
+        mapped.flush()
+    return out, list(wfc.tile_ids)
+
+
+@contextlib.contextmanager
+def _open(file, mode):
+    if hasattr(file, 'write'):
+        yield file
+    else:
+        with open(file, mode) as f:  # pylint: disable=unspecified-encoding
+            yield f
+
+
+def write_text(wfc, file) -> None:
+    """Write the grid as text, one line per row, like `str(wfc)`.
+
+    Args:
+        wfc (WaveFuctionCollapse): The solver, with a 2D grid.
+        file (Union[str, TextIO]): A path or a file opened for writing text.
+    """
+    # the visual of each tile and '?' for cells that are not fixed, at index -1
+    visuals = np.array([tile.visual for tile in wfc.tiles] + ['?'])
+    with _open(file, 'w') as f:
+        for row in wfc.collapsed:
+            f.write(''.join(visuals[row]) + '\n')
+
+
+def write_ppm(wfc, file, n_variants=8) -> None:
+    """Write the grid as binary PPM image, one row of tiles at a time.
+
+    Tiles are drawn with `Tile.graphics(variant)`, with the variant of a cell
+    given by `variant_of` its flat index, as in `Renderer`. Cells that are not
+    fixed are black.
+
+    Args:
+        wfc (WaveFuctionCollapse): The solver, with a 2D grid.
+        file (Union[str, BinaryIO]): A path or a file opened for writing bytes.
+        n_variants (int): How many images per tile to use.
+    """
+    overlays = OverlayCache(wfc.tiles, n_variants=n_variants)
+    tilesize = wfc.tiles[0].graphics_size
+    rows, cols = wfc.collapsed.shape
+    # all images, as variants x (tiles + 1 black) x rows x columns x RGB
+    atlas = overlays.atlases()
+    with _open(file, 'wb') as f:
+        f.write(f"P6\n{cols * tilesize} {rows * tilesize}\n255\n".encode())
+        for ix, row in enumerate(wfc.collapsed):
+            variants = variant_of(ix * cols + np.arange(cols), n_variants)
+            # columns x tile rows x tile columns x RGB, put next to each other
+            strip = atlas[variants, row].transpose(1, 0, 2, 3)
+            f.write(np.ascontiguousarray(strip).tobytes())
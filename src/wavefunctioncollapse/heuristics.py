@@ -0,0 +1,175 @@
+# wavefunctioncollapse
+# Copyright (C) 2023 Christian Henkel
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import abc
+import heapq
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+class Heuristic(abc.ABC):
+    """Chooses which cell the wave function collapse algorithm fixes next.
+
+    The solver calls `reset` once before generating, `update` whenever the
+    possible tiles of a cell changed and `pop` to get the next cell."""
+
+    @abc.abstractmethod
+    def reset(self, wfc) -> None:
+        """Start selecting cells for the solver wfc."""
+
+    def update(self, cell: int) -> None:
+        """The possible tiles of the cell with flat index cell have changed."""
+
+    @abc.abstractmethod
+    def pop(self) -> Optional[int]:
+        """Return the flat index of the next cell to fix, None if all are fixed."""
+
+
+class _HeapHeuristic(Heuristic):
+    """Selects the cell with the lowest key, ties are broken randomly.
+
+    Cells are pushed again whenever they change, outdated entries are skipped
+    when they come up (lazy deletion). That way, updates and selection are
+    O(log N) in the number of cells.
+
+    Cells that did not change since `reset` are not pushed at all. Their keys
+    stay as they were, so they are taken level by level, all cells with the
+    lowest key at once in random order. Resetting is O(N) in numpy only, which
+    keeps loading large checkpoints fast."""
+
+    def __init__(self) -> None:
+        self._rng = np.random.default_rng()
+        self._counts = np.zeros(0, dtype=np.int32)
+        self._collapsed = np.zeros(0, dtype=np.int32)
+        self._heap: List[Tuple[float, float, int]] = []
+        # Whether each cell is unchanged since reset and thus not in the heap.
+        self._unchanged = np.zeros(0, dtype=bool)
+        # The unchanged cells with the lowest key, in random order.
+        self._level: List[int] = []
+        self._level_key = 0.0
+        self._levels_left = False
+
+    @abc.abstractmethod
+    def _key(self, cell: int) -> float:
+        """The key of a cell, lower keys are selected first."""
+
+    @abc.abstractmethod
+    def _keys(self, cells: np.ndarray) -> np.ndarray:
+        """The keys of many cells at once."""
+
+    def reset(self, wfc) -> None:
+        self._rng = wfc.rng
+        self._counts = wfc.counts.ravel()
+        self._collapsed = wfc.collapsed.ravel()
+        self._heap = []
+        self._unchanged = self._collapsed < 0
+        self._level = []
+        self._levels_left = True
+
+    def update(self, cell: int) -> None:
+        self._unchanged[cell] = False
+        heapq.heappush(self._heap, (self._key(cell), self._rng.random(), cell))
+
+    def _next_level(self):
+        """Take the unchanged cells with the lowest key, if there are any left."""
+        cells = np.flatnonzero(self._unchanged & (self._collapsed < 0))
+        if len(cells) == 0:
+            # cells only become unchanged again by reset
+            self._levels_left = False
+            return
+        keys = self._keys(cells)
+        self._level_key = float(keys.min())
+        # popped from the end
+        self._level = self._rng.permutation(cells[keys == self._level_key]).tolist()
+
+    def pop(self) -> Optional[int]:
+        while True:
+            if not self._level and self._levels_left:
+                self._next_level()
+            if self._level and (not self._heap or self._level_key <= self._heap[0][0]):
+                cell = self._level.pop()
+                if self._unchanged[cell] and self._collapsed[cell] < 0:
+                    return cell
+                continue
+            if not self._heap:
+                return None
+            key, _, cell = heapq.heappop(self._heap)
+            if self._collapsed[cell] < 0 and key == self._key(cell):
+                return cell
+
+
+class MinCountHeuristic(_HeapHeuristic):
+    """Select the cell with the fewest possible tiles."""
+
+    def _key(self, cell: int) -> float:
+        return self._counts[cell]
+
+    def _keys(self, cells):
+        return self._counts[cells]
+
+
+class EntropyHeuristic(_HeapHeuristic):
+    """Select the cell with the lowest Shannon entropy over its possible tiles.
+
+    The tiles are weighted by their `Tile.weight`. The entropies are kept up to
+    date by the solver, with all tiles equally likely they are log(count)."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._entropies = np.zeros(0)
+
+    def reset(self, wfc) -> None:
+        self._entropies = wfc.entropies
+        super().reset(wfc)
+
+    def _key(self, cell: int) -> float:
+        return float(self._entropies[cell])
+
+    def _keys(self, cells):
+        return self._entropies[cells]
+
+
+class ScanlineHeuristic(Heuristic):
+    """Select the cells in order of their flat index, i.e. row by row."""
+
+    def __init__(self) -> None:
+        self._collapsed = np.zeros(0, dtype=np.int32)
+        self._next = 0
+
+    def reset(self, wfc) -> None:
+        self._collapsed = wfc.collapsed.ravel()
+        self._next = 0
+
+    def update(self, cell: int) -> None:
+        # cells before the cursor may be free again after undoing choices
+        self._next = min(self._next, cell)
+
+    def pop(self) -> Optional[int]:
+        while (self._next < len(self._collapsed) and
+               self._collapsed[self._next] >= 0):
+            self._next += 1
+        if self._next == len(self._collapsed):
+            return None
+        return self._next
+
+
+# The heuristics that can be selected by name.
+HEURISTICS = {
+    'count': MinCountHeuristic,
+    'entropy': EntropyHeuristic,
+    'scanline': ScanlineHeuristic,
+}
@@ -0,0 +1,46 @@
+# wavefunctioncollapse
+# Copyright (C) 2023 Christian Henkel
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import dataclasses
+from dataclasses import dataclass
+
+
+@dataclass
+class SolverStats():
+    """Counters and timers of a solver.
+
+    They are only collected if the solver is created with stats. Times are
+    cumulative wall times in seconds."""
+
+    # Number of cells fixed by a choice.
+    collapses: int = 0
+    # Number of cells looked at while propagating constraints.
+    propagation_visits: int = 0
+    # Number of tiles ruled out for a cell.
+    domain_reductions: int = 0
+    # Number of times a cell ran out of possible tiles.
+    contradictions: int = 0
+    backtracks: int = 0
+    restarts: int = 0
+    # Time spent choosing the next cell and its tile.
+    selection_time: float = 0.
+    # Time spent fixing cells, propagating and backtracking.
+    propagation_time: float = 0.
+    # Time spent in the progress callback.
+    callback_time: float = 0.
+
+    def as_dict(self) -> dict:
+        return dataclasses.asdict(self)
@@ -0,0 +1,200 @@
+# wavefunctioncollapse
+# Copyright (C) 2023 Christian Henkel
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from typing import List, Tuple
+
+import numpy as np
+import PIL.Image
+from numpy.lib.stride_tricks import sliding_window_view
+
+from wavefunctioncollapse.tileset import Neig, Tile
+
+# Characters to show values of a sample in the console, from dark to bright.
+_VISUALS = ' .:-=+*#%@'
+
+# Per direction, the parts of a pattern a and of its neighbour b that overlap.
+_OVERLAPS = {
+    Neig.UP: (np.s_[:, :-1, :], np.s_[:, 1:, :]),
+    Neig.DOWN: (np.s_[:, 1:, :], np.s_[:, :-1, :]),
+    Neig.LEFT: (np.s_[:, :, :-1], np.s_[:, :, 1:]),
+    Neig.RIGHT: (np.s_[:, :, 1:], np.s_[:, :, :-1]),
+}
+
+
+class PatternTile(Tile):
+    """A tile of the overlapping model, i.e. an N x N pattern found in a sample.
+
+    A cell with this tile gets the color of the top left pixel of the pattern,
+    the rest of the pattern overlaps with the neighbouring cells."""
+
+    def __init__(self, index, pattern, color, *args, **kwargs) -> None:
+        """Create a tile, further arguments are those of `Tile`.
+
+        Args:
+            index (int): The index of the pattern, used as id.
+            pattern (np.ndarray): The values of the pattern, N x N.
+            color (Tuple[int, int, int]): The RGB color of the top left pixel.
+        """
+        super().__init__(index, *args, **kwargs)
+        self.pattern = pattern
+        self.color = tuple(int(c) for c in color)
+
+    @property
+    def id(self):
+        return self.name
+
+    def __hash__(self) -> int:
+        return hash(self.id)
+
+    @property
+    def value(self) -> int:
+        """The value of the sample that a cell with this tile stands for."""
+        return int(self.pattern[0, 0])
+
+    def graphics(self, seed=None):
+        return PIL.Image.new('RGB', (1, 1), self.color)
+
+    @property
+    def graphics_size(self) -> int:
+        return 1
+
+
+def _to_values(sample) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the sample as 2D array of small integers and the RGB color of each value.
+
+    Images and arrays with a color per pixel are mapped to the index of the color,
+    arrays of integers are taken as they are and shown in shades of grey."""
+    sample = np.asarray(sample)
+    if sample.ndim == 3:
+        colors, values = np.unique(
+            sample.reshape(-1, sample.shape[2]), axis=0, return_inverse=True)
+        if colors.shape[1] == 1:
+            colors = np.repeat(colors, 3, axis=1)
+        values = values.reshape(sample.shape[:2])
+    elif sample.ndim == 2:
+        if sample.min() < 0:
+            raise ValueError("Sample values must not be negative")
+        values = sample
+        n_values = int(values.max()) + 1
+        grey = np.arange(n_values) * 255 // max(n_values - 1, 1)
+        colors = np.stack([grey] * 3, axis=1)
+    else:
+        raise ValueError(f"Expected a 2D sample or an image, got shape {sample.shape}")
+    dtype = np.uint8 if len(colors) <= 256 else np.uint16
+    return values.astype(dtype), colors[:, :3].astype(np.uint8)
+
+
+def _keys(patterns) -> np.ndarray:
+    """Return a key per pattern, equal for equal patterns.
+
+    Patterns whose values fit into 64 bits are packed into one integer, a
+    perfect hash that is fast to sort. Larger ones are compared as raw bytes."""
+    patterns = patterns.reshape(len(patterns), -1)
+    bits = int(patterns.max(initial=0)).bit_length()
+    if bits * patterns.shape[1] <= 64:
+        keys = np.zeros(len(patterns), dtype=np.uint64)
+        for column in range(patterns.shape[1]):
+            keys <<= np.uint64(bits)
+            keys |= patterns[:, column].astype(np.uint64)
+        return keys
+    patterns = np.ascontiguousarray(patterns)
+    return patterns.view(np.dtype((np.void, patterns.dtype.itemsize * patterns.shape[1]))
+                         ).ravel()
+
+
+def _unique(patterns, counts) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the distinct patterns and the summed counts of each."""
+    _, first, inverse = np.unique(_keys(patterns), return_index=True, return_inverse=True)
+    return patterns[first], np.bincount(inverse.ravel(), weights=counts)
+
+
+def extract_patterns(sample, n=3, rotations=False, reflections=False, periodic=True
+                     ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Find all distinct N x N patterns of a sample and how often they appear.
+
+    Args:
+        sample (np.ndarray): An image as rows x columns x channels, e.g. a PIL image
+            passed through `np.asarray`, or a 2D array of non-negative integers.
+        n (int): The width and height of the patterns.
+        rotations (bool): Add the patterns rotated by 90, 180 and 270 degrees.
+        reflections (bool): Add the patterns mirrored.
+        periodic (bool): Whether the sample wraps around at its edges, so that
+            patterns across the edges are found too.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: The patterns as patterns x n x n
+            array of values, the count of each pattern and the RGB color of each value.
+    """
+    values, colors = _to_values(sample)
+    if periodic:
+        values = np.pad(values, ((0, n - 1), (0, n - 1)), mode='wrap')
+    windows = sliding_window_view(values, (n, n)).reshape(-1, n, n)
+    patterns, counts = _unique(windows, np.ones(len(windows)))
+
+    variants = [patterns]
+    if rotations:
+        variants += [np.rot90(patterns, k, axes=(1, 2)) for k in range(1, 4)]
+    if reflections:
+        variants += [np.flip(variant, axis=2) for variant in variants]
+    if len(variants) > 1:
+        patterns, counts = _unique(np.concatenate(variants), np.tile(counts, len(variants)))
+    return patterns, counts, colors
+
+
+def get_compatible(patterns) -> np.ndarray:
+    """Return for each direction in `Neig` which patterns can be placed next to each other.
+
+    Two patterns fit if they agree where they overlap when shifted by one cell.
+    The overlaps are numbered by their keys and compared for all pairs at once.
+
+    Returns:
+        np.ndarray: compatible[d, a, b] is True if b can be placed in direction d of a.
+    """
+    compatible = np.empty((len(Neig), len(patterns), len(patterns)), dtype=bool)
+    for i_neig, neig in enumerate(Neig):
+        part_a, part_b = _OVERLAPS[neig]
+        # number the distinct overlaps of a and b together, so they are comparable
+        _, ids = np.unique(_keys(np.concatenate([patterns[part_a], patterns[part_b]])),
+                           return_inverse=True)
+        ids = ids.ravel()
+        compatible[i_neig] = ids[:len(patterns), None] == ids[None, len(patterns):]
+    return compatible
+
+
+def extract_tiles(sample, n=3, rotations=False, reflections=False, periodic=True
+                  ) -> List[PatternTile]:
+    """Learn a tileset from a sample, as the overlapping model of WFC does.
+
+    Every distinct N x N pattern of the sample becomes a tile, weighted by how
+    often it appears. Arguments are as for `extract_patterns`.
+
+    Returns:
+        List[PatternTile]: The tileset, to be used with `WaveFuctionCollapse`.
+    """
+    patterns, counts, colors = extract_patterns(
+        sample, n, rotations=rotations, reflections=reflections, periodic=periodic)
+    compatible = get_compatible(patterns)
+    neighbours = [[np.flatnonzero(row).tolist() for row in compatible_neig]
+                  for compatible_neig in compatible]
+    tiles = []
+    for index, (pattern, count) in enumerate(zip(patterns, counts)):
+        value = int(pattern[0, 0])
+        visual = _VISUALS[value * (len(_VISUALS) - 1) // max(len(colors) - 1, 1)]
+        tiles.append(PatternTile(
+            index, pattern, colors[value], visual,
+            *(neighbours[i_neig][index] for i_neig in range(len(Neig))),
+            weight=float(count)))
+    return tiles
@@ -0,0 +1,80 @@
+# wavefunctioncollapse
+# Copyright (C) 2023 Christian Henkel
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional
+
+import numpy as np
+
+from wavefunctioncollapse.export import index_dtype
+from wavefunctioncollapse.tileset import compile_tileset
+from wavefunctioncollapse.wfc import WaveFuctionCollapse, spawn_seeds
+
+# The tileset and solver options of a worker process, set by _init_worker.
+_worker_tiles: Optional[List] = None
+_worker_options: dict = {}
+
+
+def _init_worker(tiles, options):
+    """Keep the tileset in the worker and compile it once."""
+    global _worker_tiles, _worker_options  # pylint: disable=global-statement
+    _worker_tiles = tiles
+    _worker_options = options
+    compile_tileset(tiles)
+
+
+def _generate_one(size, seed) -> np.ndarray:
+    """Generate one grid and return the indices of its tiles."""
+    wfc = WaveFuctionCollapse(_worker_tiles, size, seed=seed, **_worker_options)
+    wfc.generate()
+    return wfc.collapsed.astype(index_dtype(len(wfc.tiles)))
+
+
+def generate_serial(tiles, size, n, seeds=None, **options) -> Iterator[np.ndarray]:
+    """Generate n grids one after the other.
+
+    Gives the same grids as `generate_parallel` with the same seeds.
+    Arguments are as for `generate_parallel`."""
+    _init_worker(tiles, options)
+    for seed in spawn_seeds(n, seeds):
+        yield _generate_one(size, seed)
+
+
+def generate_parallel(tiles, size, n, seeds=None, max_workers=None, chunksize=1,
+                      **options) -> Iterator[np.ndarray]:
+    """Generate n grids in a pool of processes.
+
+    Every worker compiles the tileset once. Each grid has its own seed, derived
+    from seeds, so the grids do not depend on the number of workers or on which
+    worker generated them.
+
+    Args:
+        tiles (List[Tile]): The tileset, it must be picklable.
+        size (Tuple[int, int]): The width and height of each grid.
+        n (int): The number of grids.
+        seeds (Union[None, int, SeedSequence, Sequence]): Either one seed to derive
+            the seeds of all grids from, or a sequence with a seed per grid.
+        max_workers (Optional[int]): Number of processes, default is the number of CPUs.
+        chunksize (int): How many grids are sent to a worker at once.
+        **options: Further arguments for `WaveFuctionCollapse`.
+
+    Yields:
+        np.ndarray: Per grid, in order, the index of the tile in each cell.
+    """
+    seeds = spawn_seeds(n, seeds)
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(tiles, options)) as executor:
+        yield from executor.map(_generate_one, [size] * n, seeds, chunksize=chunksize)
@@ -0,0 +1,166 @@
+# wavefunctioncollapse
+# Copyright (C) 2023 Christian Henkel
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+import PIL.Image
+
+
+def variant_of(seeds, n_variants) -> np.ndarray:
+    """Return the variant of the images of cells with the given seeds.
+
+    The seeds are mixed by a 32 bit integer hash, so that neighbouring cells
+    get unrelated variants.
+
+    Args:
+        seeds (Union[int, np.ndarray]): The seeds, i.e. the flat indices of the cells.
+        n_variants (int): The number of variants.
+    """
+    x = np.asarray(seeds).astype(np.uint64)
+    mask = np.uint64(0xFFFFFFFF)
+    x ^= x >> np.uint64(16)
+    x = (x * np.uint64(0x7feb352d)) & mask
+    x ^= x >> np.uint64(15)
+    x = (x * np.uint64(0x846ca68b)) & mask
+    x ^= x >> np.uint64(16)
+    return (x % np.uint64(n_variants)).astype(np.intp)
+
+
+class OverlayCache():
+    """Images of all tiles, and of cells that are not fixed yet, i.e. the average
+    of all their possible tiles.
+
+    Each tile is drawn n_variants times, with `Tile.graphics(variant)`, and the
+    images are kept in one atlas array. Cells are mapped to a variant by
+    `variant_of` their seed, so memory does not grow with the size of the grid.
+    Blended images are cached by their variant and possible tiles. When the cache
+    is full, the least recently used image is dropped.
+    """
+
+    def __init__(self, tiles, n_variants=8, maxsize=1024) -> None:
+        self.tiles = tiles
+        self.n_variants = n_variants
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._atlases: Optional[np.ndarray] = None
+        self._cache: OrderedDict = OrderedDict()
+
+    def atlases(self) -> np.ndarray:
+        """Return the images of all variants of all tiles, drawing them on first use.
+
+        Returns:
+            np.ndarray: Of shape (variants, tiles + 1, rows, columns, RGB), with a
+                black image after the tiles, for cells that are not fixed.
+        """
+        if self._atlases is None:
+            images = [[np.asarray(tile.graphics(variant).convert('RGB'))
+                       for tile in self.tiles] for variant in range(self.n_variants)]
+            atlases = np.zeros((self.n_variants, len(self.tiles) + 1) +
+                               images[0][0].shape, dtype=np.uint8)
+            atlases[:, :-1] = images
+            self._atlases = atlases
+        return self._atlases
+
+    def atlas(self, variant) -> np.ndarray:
+        """Return the images of all tiles for a variant, as tiles x rows x columns x RGB."""
+        return self.atlases()[variant, :-1]
+
+    def get(self, seed, possible) -> np.ndarray:
+        """Return the image of a cell.
+
+        Args:
+            seed (int): The seed of the cell.
+            possible (np.ndarray): Boolean mask of the possible tiles of the cell.
+        """
+        variant = int(variant_of(seed, self.n_variants))
+        key = (variant, np.packbits(possible).tobytes())
+        img = self._cache.get(key)
+        if img is not None:
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return img
+        self.misses += 1
+        img = self.atlas(variant)[possible].mean(axis=0).astype(np.uint8)
+        self._cache[key] = img
+        if len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+        return img
+
+
+class Renderer():
+    """Renders the grid of a solver into a persistent RGB canvas.
+
+    Only cells that changed since the last update are drawn again, so the cost
+    of a frame depends on the changes since the last frame, not on the size of
+    the grid.
+    """
+
+    def __init__(self, wfc, overlays=None) -> None:
+        """Create a renderer.
+
+        Args:
+            wfc (WaveFuctionCollapse): The solver whose grid to render.
+            overlays (Optional[OverlayCache]): Images for cells that are not fixed.
+        """
+        self.wfc = wfc
+        self.overlays = overlays if overlays is not None else OverlayCache(wfc.tiles)
+        self.tilesize = wfc.tiles[0].graphics_size
+        rows, cols = wfc.collapsed.shape
+        # The rendered grid, as rows x columns x RGB.
+        self.canvas = np.zeros((rows * self.tilesize, cols * self.tilesize, 3),
+                               dtype=np.uint8)
+
+    def update(self) -> np.ndarray:
+        """Draw all cells that changed since the last update and return the canvas."""
+        cells = self.wfc.pop_dirty_cells()
+        if len(cells) == self.wfc.collapsed.size:
+            self._draw_all()
+        else:
+            for cell in cells:
+                self._draw_cell(cell)
+        return self.canvas
+
+    def _draw_all(self):
+        """Draw the whole grid, gathering the images of the fixed cells at once."""
+        collapsed = self.wfc.collapsed
+        rows, cols = collapsed.shape
+        variants = variant_of(np.arange(collapsed.size).reshape(rows, cols),
+                              self.overlays.n_variants)
+        # rows x columns x tile rows x tile columns x RGB, black if not fixed
+        tiles = self.overlays.atlases()[variants, collapsed]
+        self.canvas[:] = tiles.transpose(0, 2, 1, 3, 4).reshape(self.canvas.shape)
+        for cell in np.flatnonzero(collapsed < 0):
+            self._draw_cell(cell)
+
+    def image(self) -> PIL.Image.Image:
+        """Update the canvas and return it as PIL image."""
+        return PIL.Image.fromarray(self.update())
+
+    def _draw_cell(self, cell):
+        ix, iy = np.unravel_index(cell, self.wfc.collapsed.shape)
+        seed = int(cell)
+        i_tile = self.wfc.collapsed[ix, iy]
+        if i_tile < 0:
+            tileimg = self.overlays.get(
+                seed, self.wfc.to_tile_mask(self.wfc.wave[ix, iy]))
+        else:
+            variant = variant_of(seed, self.overlays.n_variants)
+            tileimg = self.overlays.atlas(variant)[i_tile]
+        self.canvas[ix * self.tilesize:(ix + 1) * self.tilesize,
+                    iy * self.tilesize:(iy + 1) * self.tilesize] = tileimg
@@ -0,0 +1,163 @@
+# wavefunctioncollapse
+# Copyright (C) 2023 Christian Henkel
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tilesets made of rotated and reflected variants of a few base tiles.
+
+A base tile is declared with the label of each of its edges and a symmetry
+class, as in the simple tiled model of the original WFC. The variants it
+stands for are generated, their neighbours follow from the edge labels and
+their images are the image of the base tile, rotated and mirrored.
+"""
+
+from collections import defaultdict
+from typing import Dict, Hashable, List, Sequence, Tuple
+
+import numpy as np
+import PIL.Image
+
+from wavefunctioncollapse.tileset import OPPOSITE_NEIG, Neig, Tile
+
+# Per symmetry class, the variants of a tile as (quarter turns clockwise,
+# mirrored left to right first), named after the letters they look like.
+SYMMETRIES: Dict[str, Tuple[Tuple[int, bool], ...]] = {
+    'X': ((0, False),),
+    'I': ((0, False), (1, False)),
+    '\\': ((0, False), (1, False)),
+    'T': ((0, False), (1, False), (2, False), (3, False)),
+    'L': ((0, False), (1, False), (2, False), (3, False)),
+    'F': ((0, False), (1, False), (2, False), (3, False),
+          (0, True), (1, True), (2, True), (3, True)),
+}
+
+# The direction each direction points to after a quarter turn clockwise.
+_TURN = {Neig.UP: Neig.RIGHT, Neig.RIGHT: Neig.DOWN,
+         Neig.DOWN: Neig.LEFT, Neig.LEFT: Neig.UP}
+
+# The direction each direction points to after mirroring left to right.
+_MIRROR = {Neig.UP: Neig.UP, Neig.DOWN: Neig.DOWN,
+           Neig.LEFT: Neig.RIGHT, Neig.RIGHT: Neig.LEFT}
+
+
+def transform_edges(edges, rotation, reflected) -> Dict[Neig, Hashable]:
+    """Return the edge labels of a tile after mirroring and rotating it.
+
+    Args:
+        edges (Dict[Neig, Hashable]): The label of each edge.
+        rotation (int): Quarter turns clockwise, after mirroring.
+        reflected (bool): Whether the tile is mirrored left to right first.
+    """
+    if reflected:
+        edges = {_MIRROR[neig]: label for neig, label in edges.items()}
+    for _ in range(rotation):
+        edges = {_TURN[neig]: label for neig, label in edges.items()}
+    return edges
+
+
+def transform_image(image, rotation, reflected) -> np.ndarray:
+    """Return the pixels of an image after mirroring and rotating it, as for the edges.
+
+    Args:
+        image (Union[PIL.Image.Image, np.ndarray]): The image, rows first.
+    """
+    pixels = np.asarray(image)
+    if reflected:
+        pixels = pixels[:, ::-1]
+    return np.ascontiguousarray(np.rot90(pixels, -rotation))
+
+
+class VariantTile(Tile):
+    """A rotated or mirrored variant of a base tile.
+
+    Its image is that of the base tile, transformed. The base tile draws each
+    image once for all its variants, so it should cache its graphics."""
+
+    def __init__(self, base, rotation, reflected, name, visual, edges) -> None:
+        """Create a variant, its neighbours are set by `derive_neighbours`.
+
+        Args:
+            base (Tile): The tile in its original orientation.
+            rotation (int): Quarter turns clockwise, after mirroring.
+            reflected (bool): Whether the base tile is mirrored left to right first.
+            name (str): The name of the variant, used as id.
+            visual (str): The visual representation of the variant.
+            edges (Dict[Neig, Hashable]): The label of each edge of the variant.
+        """
+        super().__init__(name, visual, weight=base.weight)
+        self.base = base
+        self.rotation = rotation
+        self.reflected = reflected
+        self.edges = edges
+
+    @property
+    def id(self):
+        return self.name
+
+    def __hash__(self) -> int:
+        return hash(self.id)
+
+    def graphics(self, seed=None):
+        image = self.base.graphics(seed)
+        if self.rotation == 0 and not self.reflected:
+            return image
+        return PIL.Image.fromarray(transform_image(image, self.rotation, self.reflected))
+
+    @property
+    def graphics_size(self) -> int:
+        return self.base.graphics_size
+
+
+def get_variants(base, symmetry, edges, names=None, visuals=None) -> List[VariantTile]:
+    """Return the distinct variants of a base tile under its symmetry.
+
+    Args:
+        base (Tile): The tile in its original orientation, which draws the graphics.
+        symmetry (str): The symmetry class of the tile, one of `SYMMETRIES`.
+        edges (Dict[Neig, Hashable]): The label of each edge of the base tile. Two
+            tiles fit next to each other if the edges that touch have equal labels.
+        names (Optional[Sequence[str]]): The name of each variant, by default the id
+            of the base tile followed by the index of the variant.
+        visuals (Optional[Sequence[str]]): The visual of each variant, by default
+            that of the base tile.
+    """
+    if symmetry not in SYMMETRIES:
+        raise ValueError(f"Unknown symmetry {symmetry!r}, expected one of "
+                         f"{list(SYMMETRIES)}")
+    transforms = SYMMETRIES[symmetry]
+    if names is None:
+        names = [f"{base.id}{i}" for i in range(len(transforms))]
+    if visuals is None:
+        visuals = [base.visual] * len(transforms)
+    if not len(names) == len(visuals) == len(transforms):
+        raise ValueError(f"Symmetry {symmetry!r} has {len(transforms)} variants")
+    return [VariantTile(base, rotation, reflected, name, visual,
+                        transform_edges(edges, rotation, reflected))
+            for (rotation, reflected), name, visual in zip(transforms, names, visuals)]
+
+
+def derive_neighbours(tiles: Sequence[VariantTile]) -> List[VariantTile]:
+    """Set the neighbours of all tiles from their edge labels and return the tiles.
+
+    A tile is allowed in direction d of another one if its edge opposite to d has
+    the label of the edge d of the other one. Tiles are grouped by label first,
+    so the work grows with the number of tiles and not with the number of pairs.
+    """
+    for neig in Neig:
+        by_label = defaultdict(list)
+        for tile in tiles:
+            by_label[tile.edges[OPPOSITE_NEIG[neig]]].append(tile.id)
+        for tile in tiles:
+            tile.neighs[neig] = list(by_label[tile.edges[neig]])
+    return list(tiles)
@@ -0,0 +1,267 @@
+# wavefunctioncollapse
+# Copyright (C) 2023 Christian Henkel
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import abc
+import functools
+import hashlib
+from enum import auto, Enum
+from typing import Dict, Tuple, cast
+
+import numpy as np
+
+
+class Neig(Enum):
+    """Possible directions for a neighbour."""
+    UP = auto()
+    DOWN = auto()
+    LEFT = auto()
+    RIGHT = auto()
+
+
+class Neig3D(Enum):
+    """Directions for a neighbour in the layers above and below, for 3D grids."""
+    ABOVE = auto()
+    BELOW = auto()
+
+
+class HexNeig(Enum):
+    """Diagonal directions for a neighbour in the rows above and below, for hex grids."""
+    UP_LEFT = auto()
+    UP_RIGHT = auto()
+    DOWN_LEFT = auto()
+    DOWN_RIGHT = auto()
+
+
+# The opposite direction of a neighbour.
+OPPOSITE_NEIG: Dict[Enum, Enum] = {
+    Neig.UP: Neig.DOWN,
+    Neig.DOWN: Neig.UP,
+    Neig.LEFT: Neig.RIGHT,
+    Neig.RIGHT: Neig.LEFT,
+    Neig3D.ABOVE: Neig3D.BELOW,
+    Neig3D.BELOW: Neig3D.ABOVE,
+    HexNeig.UP_LEFT: HexNeig.DOWN_RIGHT,
+    HexNeig.UP_RIGHT: HexNeig.DOWN_LEFT,
+    HexNeig.DOWN_LEFT: HexNeig.UP_RIGHT,
+    HexNeig.DOWN_RIGHT: HexNeig.UP_LEFT,
+}
+
+# The index of the opposite direction, for directions in the order of `Neig`.
+OPPOSITE_IND = [list(Neig).index(cast(Neig, OPPOSITE_NEIG[neig])) for neig in Neig]
+
+# The change in indices per neighbour.
+DELTA_IND = {
+    Neig.UP: (-1, 0),
+    Neig.DOWN: (1, 0),
+    Neig.LEFT: (0, -1),
+    Neig.RIGHT: (0, 1)
+}
+
+
+class Tile():
+    """Prototype for a tile in the wave function collapse algorithm."""
+
+    def __init__(self, name, visual,
+                 neig_up=None, neig_dn=None, neig_lt=None, neig_rt=None,
+                 weight=1.0, neighs=None) -> None:
+        """Create a tile.
+
+        Args:
+            name (str): The name of the tile.
+            visual (str): The visual representation of the tile. (For output in the console.)
+            neig_up (List[str]): The ids of the tiles that can be above this tile.
+            neig_dn (List[str]): The ids of the tiles that can be below this tile.
+            neig_lt (List[str]): The ids of the tiles that can be left of this tile.
+            neig_rt (List[str]): The ids of the tiles that can be right of this tile.
+            weight (float): How often the tile is chosen relative to the others.
+            neighs (Optional[Dict[Enum, List[str]]]): The ids of the tiles allowed in
+                further directions, e.g. those of `Neig3D` or `HexNeig`.
+        """
+        self.name = name
+        self.visual = visual
+        self.weight = weight
+        self.neighs = {
+            Neig.UP: neig_up if neig_up is not None else [],
+            Neig.DOWN: neig_dn if neig_dn is not None else [],
+            Neig.LEFT: neig_lt if neig_lt is not None else [],
+            Neig.RIGHT: neig_rt if neig_rt is not None else [],
+        }
+        if neighs is not None:
+            self.neighs.update(neighs)
+
+    def __eq__(self, __value) -> bool:
+        return self.id == __value.id
+    
+    def graphics(self):
+        raise NotImplementedError
+    
+    @property
+    def graphics_size(self) -> int:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def __hash__(self) -> int:
+        return self.id
+
+    @property
+    def id(self) -> int:
+        raise NotImplementedError
+
+
+class CompiledTileset():
+    """The adjacency rules of a tileset in array form.
+
+    Tiles are referred to by their index in the tileset. Use `compile_tileset`
+    to get the compiled form of a list of tiles, it is only built once per
+    distinct tileset and shared by all solvers using it.
+    """
+
+    def __init__(self, rules, directions=tuple(Neig)) -> None:
+        """Compile and verify the rules of a tileset.
+
+        Args:
+            rules (Tuple): For every tile its id, per direction the ids of the tiles
+                allowed there and its weight, as returned by `_get_rules`.
+            directions (Tuple[Enum, ...]): The directions of the rules.
+        """
+        self.directions = directions
+        # The index of the opposite direction, for each direction.
+        self.opposite = [directions.index(OPPOSITE_NEIG[neig]) for neig in directions]
+        self.tile_ids = [tile_id for tile_id, _, _ in rules]
+        self.tile_index = {tile_id: i for i, tile_id in enumerate(self.tile_ids)}
+        if len(self.tile_index) != len(self.tile_ids):
+            raise ValueError("Invalid tileset: tile ids are not unique")
+        self.hash = hashlib.sha256(
+            repr((rules, [str(neig) for neig in directions])).encode()).hexdigest()
+        n_tiles = len(self.tile_ids)
+        self.weights = np.array([weight for _, _, weight in rules], dtype=np.float64)
+        if not np.all(self.weights > 0):
+            raise ValueError("Invalid tileset: weights must be positive")
+        # w * log(w) per tile, for the entropy of a cell.
+        self.weight_log_weights = self.weights * np.log(self.weights)
+        # With equal weights, tiles can be chosen by index.
+        self.uniform = bool(np.all(self.weights == self.weights[0]))
+        # Per direction, compatible[d, a, b] is 1 if b can be placed in direction d of a.
+        dtype = np.int16 if n_tiles < np.iinfo(np.int16).max else np.int32
+        self.compatible = np.zeros((len(directions), n_tiles, n_tiles), dtype=dtype)
+        for i_neig in range(len(directions)):
+            i_tiles = [i_tile for i_tile, (_, neighs, _) in enumerate(rules)
+                       for _ in neighs[i_neig]]
+            try:
+                i_others = [self.tile_index[other] for _, neighs, _ in rules
+                            for other in neighs[i_neig]]
+            except KeyError as e:
+                raise ValueError(f"Invalid tileset: unknown tile {e}") from e
+            self.compatible[i_neig, i_tiles, i_others] = 1
+        self._verify_tileset(rules)
+        for array in (self.compatible, self.weights, self.weight_log_weights):
+            array.flags.writeable = False
+
+    def _verify_tileset(self, rules):
+        """Verify that the tileset is valid.
+
+        i.e. that all tiles neighours must also have this tile as a neighbour."""
+        for i_neig, i_opposite in enumerate(self.opposite):
+            missing = np.argwhere(
+                self.compatible[i_neig] > self.compatible[i_opposite].T)
+            if len(missing):
+                i_tile, i_other = missing[0]
+                raise ValueError(
+                    f"Invalid tileset: {self.tile_ids[i_tile]} not in " +
+                    f"{list(rules[i_other][1][i_opposite])}" +
+                    f" of {self.tile_ids[i_other]}")
+
+    def __len__(self) -> int:
+        return len(self.tile_ids)
+
+
+def _get_rules(tiles, directions=tuple(Neig)):
+    """Return the adjacency rules of tiles in the given directions as nested tuples."""
+    return tuple(
+        (tile.id, tuple(tuple(tile.neighs.get(neig, ())) for neig in directions),
+         float(tile.weight))
+        for tile in tiles)
+
+
+@functools.lru_cache(maxsize=64)
+def _compile_rules(rules, directions) -> CompiledTileset:
+    return CompiledTileset(rules, directions)
+
+
+def compile_tileset(tiles, directions=tuple(Neig)) -> CompiledTileset:
+    """Return the compiled rules of a tileset.
+
+    Tilesets with the same ids, rules and directions share one `CompiledTileset`.
+
+    Args:
+        tiles (List[Tile]): The tileset.
+        directions (Tuple[Enum, ...]): The directions of the grid, as given by
+            `Topology.directions`.
+    """
+    directions = tuple(directions)
+    return _compile_rules(_get_rules(tiles, directions), directions)
+
+
+@functools.lru_cache(maxsize=64)
+def minimize_tileset(compiled, prune=False) -> Tuple[CompiledTileset, np.ndarray]:
+    """Return a smaller tileset that gives the same grids as compiled.
+
+    Tiles that are allowed next to the same tiles in every direction are
+    interchangeable, they are merged into one class with their summed weight.
+    Which tile of a class a cell gets can be chosen when the cell is fixed.
+
+    Args:
+        compiled (CompiledTileset): The tileset.
+        prune (bool): Also drop tiles that can not be supported in some direction,
+            even when all other tiles that can not be supported are dropped. This
+            is only valid if every cell has a neighbour in every direction, as in
+            periodic grids, since the edges of other grids need no support.
+
+    Returns:
+        Tuple[CompiledTileset, np.ndarray]: The tileset of the classes, with a tuple
+            of the ids of its tiles as id of each class, and the index of the class
+            of each tile of compiled, -1 for dropped tiles.
+    """
+    compatible = compiled.compatible > 0
+    keep = np.ones(len(compiled), dtype=bool)
+    while prune:
+        supported = keep & compatible[:, :, keep].any(axis=2).all(axis=0)
+        prune = (supported != keep).any()
+        keep = supported
+    if not keep.any():
+        raise ValueError("Invalid tileset: no tile can be supported")
+    kept = np.flatnonzero(keep)
+    # the tiles a tile is allowed next to in all directions, one row per tile
+    signatures = compatible[:, kept][:, :, kept].transpose(1, 0, 2).reshape(len(kept), -1)
+    _, first, inverse = np.unique(signatures, axis=0, return_index=True,
+                                  return_inverse=True)
+    # number the classes in the order of their first tile
+    order = np.argsort(first)
+    representatives = kept[first[order]]
+    tile_class = np.full(len(compiled), -1, dtype=np.intp)
+    tile_class[kept] = np.argsort(order)[inverse.ravel()]
+    class_ids = [tuple(compiled.tile_ids[i_tile]
+                       for i_tile in np.flatnonzero(tile_class == i_class))
+                 for i_class in range(len(representatives))]
+    rules = tuple(
+        (class_id,
+         tuple(tuple(class_ids[i_other] for i_other in
+                     np.flatnonzero(compatible[i_neig, i_tile, representatives]))
+               for i_neig in range(len(compiled.directions))),
+         float(compiled.weights[tile_class == i_class].sum()))
+        for i_class, (class_id, i_tile) in enumerate(zip(class_ids, representatives)))
+    tile_class.flags.writeable = False
+    return _compile_rules(rules, compiled.directions), tile_class
@@ -0,0 +1,141 @@
+# wavefunctioncollapse
+# Copyright (C) 2023 Christian Henkel
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import abc
+import functools
+from enum import Enum
+from typing import Sequence, Tuple
+
+import numpy as np
+
+from wavefunctioncollapse.tileset import DELTA_IND, HexNeig, Neig, Neig3D
+
+
+class Topology(abc.ABC):
+    """The layout of the cells of a grid and which cells are neighbours.
+
+    The solver only sees the table of neighbours, so any layout can be used
+    with the same propagation code."""
+
+    # The directions of the neighbours of a cell, in the order of the table.
+    directions: Tuple[Enum, ...] = ()
+
+    def __init__(self, periodic=False) -> None:
+        """Create a topology.
+
+        Args:
+            periodic (bool): Whether the grid wraps around at its edges, so that
+                cells on opposite edges are neighbours.
+        """
+        self.periodic = periodic
+
+    def shape(self, size) -> Tuple[int, ...]:
+        """Return the shape of the arrays of a grid of the given size.
+
+        Sizes are given with the width first, arrays are indexed by row first,
+        so the shape is the reversed size."""
+        return tuple(reversed(size))
+
+    @abc.abstractmethod
+    def _deltas(self, indices) -> Sequence[Tuple]:
+        """Per direction, the change of the indices of each cell to its neighbour.
+
+        Args:
+            indices (np.ndarray): The indices of all cells, as by `np.indices`.
+        """
+
+    def neighbours(self, shape) -> np.ndarray:
+        """Return the flat index of the neighbour of every cell in every direction.
+
+        The table is computed once per shape and shared, it must not be changed.
+
+        Args:
+            shape (Tuple[int, ...]): The shape of the grid, as by `shape`.
+
+        Returns:
+            np.ndarray: Of shape (cells, directions), with directions in the order of
+                `directions`. It is -1 where the neighbour is outside the grid.
+        """
+        return _neighbour_table(self, tuple(shape))
+
+    def __eq__(self, other) -> bool:
+        return type(self) is type(other) and self.periodic == other.periodic
+
+    def __hash__(self) -> int:
+        return hash((type(self), self.periodic))
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(periodic={self.periodic})"
+
+
+@functools.lru_cache(maxsize=32)
+def _neighbour_table(topology, shape) -> np.ndarray:
+    indices = np.indices(shape)
+    table = np.empty((int(np.prod(shape)), len(topology.directions)), dtype=np.intp)
+    for i_neig, delta in enumerate(topology._deltas(indices)):  # pylint: disable=protected-access
+        neig = [ind + d for ind, d in zip(indices, delta)]
+        inside = np.ones(shape, dtype=bool)
+        if not topology.periodic:
+            for ind, n in zip(neig, shape):
+                inside &= (ind >= 0) & (ind < n)
+        flat = np.ravel_multi_index(neig, shape, mode='wrap')
+        table[:, i_neig] = np.where(inside, flat, -1).ravel()
+    table.flags.writeable = False
+    return table
+
+
+class Grid2D(Topology):
+    """A grid of squares, with neighbours in the directions of `Neig`."""
+
+    directions = tuple(Neig)
+
+    def _deltas(self, indices):
+        return [DELTA_IND[neig] for neig in self.directions]
+
+
+class Grid3D(Topology):
+    """A grid of cubes, arranged in layers of 2D grids.
+
+    Sizes are given as (width, height, depth), cells are indexed as
+    [layer][row][column]. The layer above has the next higher index."""
+
+    directions = tuple(Neig) + tuple(Neig3D)
+
+    def _deltas(self, indices):
+        deltas = {neig: (0,) + DELTA_IND[neig] for neig in Neig}
+        deltas[Neig3D.ABOVE] = (1, 0, 0)
+        deltas[Neig3D.BELOW] = (-1, 0, 0)
+        return [deltas[neig] for neig in self.directions]
+
+
+class HexGrid(Topology):
+    """A grid of hexagons with pointy tops, in rows of which every odd one is
+    shifted right by half a cell.
+
+    Each cell has neighbours to its left and right and two each in the rows
+    above and below. If the grid is periodic, the number of rows must be even."""
+
+    directions = (HexNeig.UP_LEFT, HexNeig.UP_RIGHT, Neig.LEFT, Neig.RIGHT,
+                  HexNeig.DOWN_LEFT, HexNeig.DOWN_RIGHT)
+
+    def _deltas(self, indices):
+        odd = indices[0] % 2
+        return [(-1, odd - 1), (-1, odd), (0, -1), (0, 1), (1, odd - 1), (1, odd)]
+
+    def neighbours(self, shape) -> np.ndarray:
+        if self.periodic and shape[0] % 2:
+            raise ValueError("A periodic hex grid needs an even number of rows")
+        return super().neighbours(shape)
@@ -14,259 +14,924 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import abc
-from enum import auto, Enum
-from typing import List, Set
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
 from itertools import product
 
 import numpy as np
-import PIL.Image
-from PIL import ImageFont, ImageDraw
 
+from wavefunctioncollapse.backends import BACKENDS, Backend
+from wavefunctioncollapse.heuristics import HEURISTICS, Heuristic
+from wavefunctioncollapse.instrumentation import SolverStats
+from wavefunctioncollapse.render import Renderer
+# Neig, DELTA_IND, OPPOSITE_NEIG and Tile are part of the interface of this module.
+from wavefunctioncollapse.tileset import (  # pylint: disable=unused-import
+    DELTA_IND, OPPOSITE_NEIG, CompiledTileset, Neig, Tile, compile_tileset,
+    minimize_tileset)
+from wavefunctioncollapse.topology import Grid2D, Topology
+
+_logger = logging.getLogger(__name__)
+
+# The arc consistent states of empty grids, by tileset, grid, boundary and backend,
+# as (arrays, whether the state of the backend is included). Arrays that follow
+# from the wave are left out, see _update_sums.
+_initial_states: OrderedDict = OrderedDict()
+_INITIAL_STATES_MAXSIZE = 8
+# The most memory the cached arrays may take together, in bytes.
+_INITIAL_STATES_MAXBYTES = 64 * 2**20
+
+
+def get_neighbours(shape):
+    """Return the flat index of the neighbour of every cell in every direction.
+
+    Args:
+        shape (Tuple[int, int]): The number of rows and columns of the grid.
+
+    Returns:
+        np.ndarray: Of shape (cells, directions), with directions in the order of
+            `Neig`. It is -1 where the neighbour is outside the grid.
+    """
+    return Grid2D().neighbours(shape).copy()
+
+
+def spawn_seeds(n, seeds=None):
+    """Return a seed for each of n independent runs.
+
+    Args:
+        n (int): The number of runs.
+        seeds (Union[None, int, SeedSequence, Sequence]): Either one seed to derive
+            independent seeds for all runs from, or a sequence with a seed per run.
+    """
+    if seeds is None or isinstance(seeds, (int, np.integer, np.random.SeedSequence)):
+        if not isinstance(seeds, np.random.SeedSequence):
+            seeds = np.random.SeedSequence(seeds)
+        return seeds.spawn(n)
+    if len(seeds) != n:
+        raise ValueError(f"Expected {n} seeds, got {len(seeds)}")
+    return list(seeds)
+
+
+class Step(NamedTuple):
+    """A step of `WaveFuctionCollapse.iter_steps`."""
+    # Flat index of the cell that was fixed.
+    cell: int
+    # Index of the tile it was fixed to.
+    tile: int
+    # Number of cells that lost tiles, including the cell, 0 if backtracked.
+    changed: int
+    # Whether the step led to a contradiction and was undone.
+    backtracked: bool
+
+
+class _Trail():
+    """The bans and fixed cells of a run, in order, so that they can be undone.
+
+    Entries are kept as rows (cell, tile) of a growing integer array, one per
+    banned tile and with tile -1 for fixing the cell. Positions count all
+    entries ever added, also those dropped from the start by `drop_before`."""
+
+    _MIN_CAPACITY = 1024
+
+    def __init__(self) -> None:
+        self._entries = np.empty((self._MIN_CAPACITY, 2), dtype=np.int32)
+        self._start = 0
+        self._end = 0
+
+    def __len__(self) -> int:
+        return self._start + self._end
+
+    def _reserve(self, n):
+        if self._end + n > len(self._entries):
+            entries = np.empty((max(2 * len(self._entries), self._end + n), 2),
+                               dtype=np.int32)
+            entries[:self._end] = self._entries[:self._end]
+            self._entries = entries
+
+    def add_fixed(self, cell) -> None:
+        """Record that the cell was fixed."""
+        self._reserve(1)
+        self._entries[self._end] = (cell, -1)
+        self._end += 1
+
+    def add_bans(self, cell, i_tiles) -> None:
+        """Record that the tiles i_tiles were banned from the cell."""
+        self._reserve(len(i_tiles))
+        self._entries[self._end:self._end + len(i_tiles), 0] = cell
+        self._entries[self._end:self._end + len(i_tiles), 1] = i_tiles
+        self._end += len(i_tiles)
+
+    def pop(self, stop=0) -> Tuple[int, Optional[np.ndarray]]:
+        """Remove the last entry and return it as (cell, None) for a fixed cell,
+        or (cell, i_tiles) for the tiles banned from the cell one after another,
+        not going back further than the position stop."""
+        self._end -= 1
+        cell, i_tile = self._entries[self._end].tolist()
+        if i_tile < 0:
+            return cell, None
+        first = self._end
+        while (first > max(stop - self._start, 0) and self._entries[first - 1, 0] == cell and
+               self._entries[first - 1, 1] >= 0):
+            first -= 1
+        i_tiles = self._entries[first:self._end + 1, 1].astype(np.intp)
+        self._end = first
+        return cell, i_tiles
+
+    def cells_since(self, position) -> np.ndarray:
+        """Return the distinct cells of the entries from position on."""
+        return np.unique(self._entries[max(position - self._start, 0):self._end, 0])
+
+    def drop_before(self, position) -> None:
+        """Forget the entries before position, they can not be undone anymore."""
+        n = position - self._start
+        # moving the rest is only worth it when much is dropped
+        if n > self._end // 2:
+            self._entries[:self._end - n] = self._entries[n:self._end]
+            self._start += n
+            self._end -= n
+
+    def clear(self) -> None:
+        """Forget all entries and free the memory they took."""
+        self._entries = np.empty((self._MIN_CAPACITY, 2), dtype=np.int32)
+        self._start = 0
+        self._end = 0
+
+
+class _IdleHeuristic(Heuristic):
+    """Ignores all changes, until the solver is ready to choose cells."""
+
+    def reset(self, wfc) -> None:
+        pass
+
+    def pop(self) -> Optional[int]:
+        return None
+
+
+class _CellView():
+    """Read/write view of a per-cell property of the wave.
+
+    Indexing it behaves like the nested lists that used to hold the solver
+    state, e.g. `view[ix][iy]`, while the data lives in numpy arrays.
+    """
+
+    def __init__(self, get_cell, set_cell, shape, prefix=()):
+        self._get_cell = get_cell
+        self._set_cell = set_cell
+        self._shape = shape
+        self._prefix = prefix
+
+    def _index(self, i):
+        return self._prefix + (range(self._shape[len(self._prefix)])[i],)
+
+    def _is_leaf(self):
+        return len(self._prefix) + 1 == len(self._shape)
+
+    def __len__(self) -> int:
+        return self._shape[len(self._prefix)]
+
+    def __getitem__(self, i):
+        ind = self._index(i)
+        if self._is_leaf():
+            return self._get_cell(ind)
+        return _CellView(self._get_cell, self._set_cell, self._shape, ind)
+
+    def __setitem__(self, i, value):
+        if not self._is_leaf():
+            raise TypeError("Only single cells can be assigned")
+        self._set_cell(self._index(i), value)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def tolist(self) -> list:
+        """Return a copy of the viewed data as nested lists."""
+        if self._is_leaf():
+            return list(self)
+        return [row.tolist() for row in self]
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, _CellView):
+            other = other.tolist()
+        return self.tolist() == other
+
+    def __repr__(self) -> str:
+        return repr(self.tolist())
 
-class Neig(Enum):
-    """Possible directions for a neighbour."""
-    UP = auto()
-    DOWN = auto()
-    LEFT = auto()
-    RIGHT = auto()
 
+class WaveFuctionCollapse():
+    """The wave function collapse algorithm."""
 
-# The opposite direction of a neighbour.
-OPPOSITE_NEIG = {
-    Neig.UP: Neig.DOWN,
-    Neig.DOWN: Neig.UP,
-    Neig.LEFT: Neig.RIGHT,
-    Neig.RIGHT: Neig.LEFT
-}
+    def __init__(self, tiles, size, heuristic='count',
+                 max_backtracks=1000, max_backtrack_depth=None, max_restarts=10,
+                 seed=None, stats=False, trace=None, topology=None, backend=None,
+                 boundary=None, state=None, minimize=False):
+        """Create a solver.
 
-# The change in indices per neighbour.
-DELTA_IND = {
-    Neig.UP: (-1, 0),
-    Neig.DOWN: (1, 0),
-    Neig.LEFT: (0, -1),
-    Neig.RIGHT: (0, 1)
-}
+        Args:
+            tiles (List[Tile]): The tileset.
+            size (Tuple[int, ...]): The width and height of the grid, and its depth
+                for 3D topologies.
+            heuristic (Union[str, Heuristic]): How to choose the next cell to fix,
+                one of 'count', 'entropy' and 'scanline' or a `Heuristic` instance.
+            max_backtracks (int): How often a contradiction may be resolved by undoing
+                the last choice before starting over.
+            max_backtrack_depth (Optional[int]): How many of the latest choices can be
+                undone, None for all.
+            max_restarts (int): How often to start over before giving up.
+            seed (Union[None, int, SeedSequence, Generator]): Seed of the random
+                generator used for all choices, the same seed gives the same grid.
+            stats (Union[bool, SolverStats]): Whether to collect `SolverStats`, or the
+                instance to add them to. They are found in `stats` afterwards.
+            trace (Optional[Callable]): Called as trace(event, **data) for the events
+                'collapse' (cell, tile), 'contradiction' (cell), 'backtrack' (cell, tile)
+                and 'restart' while generating.
+            topology (Optional[Topology]): The layout of the cells, default is a 2D
+                grid of squares without wrapping around.
+            backend (Union[None, str, Backend]): How to propagate constraints, one of
+                'numpy' and 'reference' or a `Backend` instance. The default is taken
+                from the environment variable WFC_BACKEND, else 'numpy'.
+            boundary (Optional[str]): What is outside the grid. None means anything, so
+                cells at the edges are not constrained. Otherwise it is the id of a tile
+                that all cells at the edges must allow next to them.
+            state (Optional[Dict[str, np.ndarray]]): The arrays of a solver to continue
+                from, as returned by `get_state`, instead of an empty grid. They are
+                used as they are, without copying.
+            minimize (bool): Solve for classes of interchangeable tiles instead of
+                single tiles, see `minimize_tileset`. Which tile of a class a cell
+                gets is chosen by weight when the cell is fixed. Tiles that can never
+                be placed are dropped too if the topology is periodic. Entropies and
+                counts are those of the classes then.
+
+        Raises:
+            ValueError: If the tileset can not fill a grid of this size and boundary.
+        """
+        self.tiles = tiles
+        self.tiles_by_id = {tile.id: tile for tile in self.tiles}
+        self.topology: Topology = topology if topology is not None else Grid2D()
+        self.compiled: CompiledTileset = compile_tileset(tiles, self.topology.directions)
+        self.size = size
+        shape = self.topology.shape(size)
+        # Tiles are referred to by their index in `tiles` internally.
+        self.tile_ids = self.compiled.tile_ids
+        self.tile_index = self.compiled.tile_index
+        # The wave is over classes of tiles, see to_tile_mask. Without minimize,
+        # every tile is its own class and tile_class is None.
+        self.tile_class: Optional[np.ndarray] = None
+        self._classes: CompiledTileset = self.compiled
+        if minimize:
+            self._classes, self.tile_class = minimize_tileset(
+                self.compiled, prune=self.topology.periodic)
+            self._members = [np.flatnonzero(self.tile_class == i_class)
+                             for i_class in range(len(self._classes))]
+        self._compatible = self._classes.compatible
+        self._opposite = self._classes.opposite
+        self._weights = self._classes.weights
+        self._weight_log_weights = self._classes.weight_log_weights
+        self.boundary = boundary
+        self._neighbours = self.topology.neighbours(shape)
+        if backend is None:
+            backend = os.environ.get('WFC_BACKEND', 'numpy')
+        if isinstance(backend, str):
+            if backend not in BACKENDS:
+                raise ValueError(f"Unknown backend {backend}")
+            backend = BACKENDS[backend]()
+        self._backend: Backend = backend
+        # Initial states are shared by all solvers with the same key, see _init_state.
+        self._initial_state_key = (self._classes.hash, shape, self.topology, boundary,
+                                   type(backend))
+        cached, complete = _initial_states.get(self._initial_state_key, (None, False))
+        warm = state is None and complete
+        if warm:
+            _initial_states.move_to_end(self._initial_state_key)
+            state = self._get_initial_state(shape, cached['wave'].copy())
+            state.update((name, array.copy()) for name, array in cached.items()
+                         if name != 'wave')
+        fresh = state is None
+        if fresh:
+            state = self._get_initial_state(shape)
+        elif state['wave'].shape != shape + (len(self._classes),):
+            raise ValueError("The state does not fit the size and tileset")
+        # The wave holds for every cell and tile whether the tile is still possible.
+        self.wave = state['wave']
+        self._wave_flat = self.wave.reshape(-1, len(self._classes))
+        # Index of the tile each cell has been fixed to, -1 if not fixed yet.
+        self.collapsed = state['collapsed']
+        # The number of possible tiles for each cell.
+        self.counts = state['counts']
+        self._counts_flat = self.counts.ravel()
+        # Per cell, the sum of the weights w of the possible tiles, the sum of
+        # w * log(w) and the Shannon entropy, updated whenever tiles are removed.
+        self._sum_weights = state['sum_weights']
+        self._sum_weight_log_weights = state['sum_weight_log_weights']
+        self.entropies = state['entropies']
+        # Cells that changed since pop_dirty_cells was called last, initially all.
+        self._dirty = np.ones(len(self._wave_flat), dtype=bool)
+        self._dirty_cells: List[int] = []
+        self._all_dirty = True
+        self._renderer: Optional[Renderer] = None
+        # The initial wave, bit-packed per cell, if it is not in the shared cache.
+        self._initial_wave: Optional[np.ndarray] = None
+        # Every ban and fixed cell is recorded on the trail, so it can be undone.
+        self._trail = _Trail()
+        # Per choice made: the length of the trail before, the cell and the class.
+        self._decisions: List[Tuple[int, int, int]] = []
+        self._decisions_dropped = False
+        # The initial propagation neither draws random numbers nor counts in the
+        # stats, so that a cached initial state gives the same grids.
+        self.stats: Optional[SolverStats] = None
+        self._heuristic: Heuristic = _IdleHeuristic()
+        self._backend.reset(self, None if fresh else {
+            name[len('backend.'):]: array for name, array in state.items()
+            if name.startswith('backend.')})
+        if fresh:
+            self._init_state()
+        elif warm:
+            self._update_sums()
+        self.rng = np.random.default_rng(seed)
+        if stats is True:
+            stats = SolverStats()
+        self.stats = stats or None
+        self.trace = trace
+        if isinstance(heuristic, str):
+            heuristic = HEURISTICS[heuristic]()
+        self._heuristic = heuristic
+        self._heuristic.reset(self)
+        self.max_backtracks = max_backtracks
+        self.max_backtrack_depth = max_backtrack_depth
+        self.max_restarts = max_restarts
+        # How often the last run had to undo a choice and to start over.
+        self.backtracks = 0
+        self.restarts = 0
+
+    def _get_initial_state(self, shape, wave=None):
+        """Return the arrays of an empty grid with all tiles possible.
+
+        If a wave is given, the arrays are made for it, but only after
+        _update_sums the counts and sums fit it."""
+        n_tiles = len(self._classes)
+        n_cells = int(np.prod(shape))
+        sum_weights = np.full(n_cells, self._weights.sum())
+        sum_weight_log_weights = np.full(n_cells, self._weight_log_weights.sum())
+        return {
+            'wave': np.ones(shape + (n_tiles,), dtype=bool) if wave is None else wave,
+            'collapsed': np.full(shape, -1, dtype=np.int32),
+            'counts': np.full(shape, n_tiles, dtype=np.int32),
+            'sum_weights': sum_weights,
+            'sum_weight_log_weights': sum_weight_log_weights,
+            'entropies': np.log(sum_weights) - sum_weight_log_weights / sum_weights,
+        }
 
+    def _init_state(self):
+        """Make the empty grid arc consistent and keep it for the next solvers.
+
+        Tiles that can not be placed next to the boundary, or that lack support
+        in any other way, are ruled out once for all solvers with the same
+        tileset, grid, boundary and backend."""
+        if self.boundary is not None:
+            i_boundary = self._to_class(self.tile_index[self.boundary])
+            allowed = np.ones(self._wave_flat.shape, dtype=bool)
+            for i_neig in range(self._neighbours.shape[1]):
+                edge = self._neighbours[:, i_neig] < 0
+                allowed[edge] &= self._compatible[i_neig, :, i_boundary] > 0
+            cells = np.flatnonzero(~allowed.all(axis=1))
+            ok = self._restrict(cells, allowed[cells])
+        else:
+            ok = self._propagate()
+        if not ok:
+            raise ValueError(f"The tileset can not fill a grid of size {self.size}")
+        self._trail.clear()
+        # the same sums as for solvers that start from the cache
+        self._update_sums()
+        arrays = {'wave': self.wave}
+        arrays.update((name, array) for name, array in self.get_state().items()
+                      if name.startswith('backend.'))
+        complete = True
+        if sum(array.nbytes for array in arrays.values()) > _INITIAL_STATES_MAXBYTES:
+            # the wave alone still saves propagating again in regenerate
+            arrays, complete = {'wave': self.wave}, False
+            if self.wave.nbytes > _INITIAL_STATES_MAXBYTES:
+                # kept by this solver only, at an eighth of the size
+                self._initial_wave = np.packbits(self._wave_flat, axis=1)
+                return
+        cached = {}
+        for name, array in arrays.items():
+            cached[name] = array.copy()
+            cached[name].flags.writeable = False
+        _initial_states[self._initial_state_key] = (cached, complete)
+        while len(_initial_states) > _INITIAL_STATES_MAXSIZE or sum(
+                array.nbytes for arrays, _ in _initial_states.values()
+                for array in arrays.values()) > _INITIAL_STATES_MAXBYTES:
+            _initial_states.popitem(last=False)
+
+    def _update_sums(self):
+        """Compute the counts, sums of weights and entropies of all cells from the wave."""
+        self._counts_flat[:] = self._wave_flat.sum(axis=1)
+        self._sum_weights[:] = self._wave_flat @ self._weights
+        self._sum_weight_log_weights[:] = self._wave_flat @ self._weight_log_weights
+        possible = self._counts_flat > 0
+        self.entropies[:] = -np.inf
+        self.entropies[possible] = (
+            np.log(self._sum_weights[possible]) -
+            self._sum_weight_log_weights[possible] / self._sum_weights[possible])
+
+    def _get_initial_domains(self, cells):
+        """Return the possible classes of the cells in the empty grid, as after _init_state."""
+        if self._initial_wave is None:
+            if self._initial_state_key in _initial_states:
+                wave = _initial_states[self._initial_state_key][0]['wave']
+                return wave.reshape(self._wave_flat.shape)[cells]
+            # made from a state, or evicted from the cache since, so propagate once
+            wave = WaveFuctionCollapse(
+                self.tiles, self.size, topology=self.topology,
+                backend=type(self._backend)(), boundary=self.boundary,
+                minimize=self.tile_class is not None).wave
+            self._initial_wave = np.packbits(wave.reshape(self._wave_flat.shape), axis=1)
+        return np.unpackbits(self._initial_wave[cells], axis=1,
+                             count=len(self._classes)).astype(bool)
+
+    def get_state(self) -> Dict[str, np.ndarray]:
+        """Return the arrays that make up the state of the grid, without copying.
+
+        Together with the tileset and options, they are enough to continue where
+        the solver is now, see the state argument and `checkpoint.py`. The state of
+        the backend is included with names starting with 'backend.'."""
+        state = {
+            'wave': self.wave,
+            'collapsed': self.collapsed,
+            'counts': self.counts,
+            'sum_weights': self._sum_weights,
+            'sum_weight_log_weights': self._sum_weight_log_weights,
+            'entropies': self.entropies,
+        }
+        for name, array in self._backend.get_state().items():
+            state['backend.' + name] = array
+        return state
 
-class Tile():
-    """Prototype for a tile in the wave function collapse algorithm."""
+    def _update_entropy(self, cell):
+        """Compute the entropy of a cell from its sums of weights.
 
-    def __init__(self, name, visual,
-                 neig_up, neig_dn, neig_lt, neig_rt) -> None:
-        """Create a tile.
+        With p = w / W for the weights w of the possible tiles and their sum W,
+        the entropy is -sum(p log p) = log(W) - sum(w log w) / W."""
+        if self._counts_flat[cell] == 0:
+            self.entropies[cell] = -np.inf
+            return
+        sum_weights = self._sum_weights[cell]
+        self.entropies[cell] = (math.log(sum_weights) -
+                                self._sum_weight_log_weights[cell] / sum_weights)
+
+    def _get_grid_cell(self, ind):
+        i_tile = self.collapsed[ind]
+        if i_tile < 0:
+            return None
+        return self.tile_ids[i_tile]
+
+    def _set_grid_cell(self, ind, tile_id):
+        self._forget_choices()
+        if tile_id is None:
+            self.collapsed[ind] = -1
+            cell = np.ravel_multi_index(ind, self.collapsed.shape)
+            self._heuristic.update(cell)
+            self._mark_dirty(cell)
+        else:
+            i_tile = self.tile_index[tile_id]
+            self._collapse(np.ravel_multi_index(ind, self.collapsed.shape),
+                           self._to_class(i_tile), i_tile)
+            self._propagate()
+
+    def _get_possible_tiles_cell(self, ind) -> Set:
+        return {self.tile_ids[i_tile]
+                for i_tile in np.flatnonzero(self.to_tile_mask(self.wave[ind]))}
+
+    def _set_possible_tiles_cell(self, ind, tile_ids):
+        """Restrict the cell to tile_ids. Tiles that were ruled out stay ruled out."""
+        self._forget_choices()
+        keep = np.zeros((1, len(self.tiles)), dtype=bool)
+        keep[0, [self.tile_index[tile_id] for tile_id in tile_ids]] = True
+        self._restrict([np.ravel_multi_index(ind, self.collapsed.shape)],
+                       self._to_class_mask(keep))
+
+    def to_tile_mask(self, mask) -> np.ndarray:
+        """Return a boolean mask over the classes of the wave as mask over the tiles.
 
         Args:
-            name (str): The name of the tile.
-            visual (str): The visual representation of the tile. (For output in the console.)
-            neig_up (List[str]): The ids of the tiles that can be above this tile.
-            neig_dn (List[str]): The ids of the tiles that can be below this tile.
-            neig_lt (List[str]): The ids of the tiles that can be left of this tile.
-            neig_rt (List[str]): The ids of the tiles that can be right of this tile.
+            mask (np.ndarray): A mask with classes along the last axis, e.g. `wave`.
         """
-        self.name = name
-        self.visual = visual
-        self.neighs = {
-            Neig.UP: neig_up,
-            Neig.DOWN: neig_dn,
-            Neig.LEFT: neig_lt,
-            Neig.RIGHT: neig_rt
-        }
+        if self.tile_class is None:
+            return mask
+        # dropped tiles have class -1 and get the False appended
+        mask = np.concatenate([mask, np.zeros(mask.shape[:-1] + (1,), dtype=bool)],
+                              axis=-1)
+        return mask[..., self.tile_class]
+
+    def _to_class_mask(self, allowed):
+        """Return a boolean mask over the tiles as mask over the classes."""
+        if self.tile_class is None:
+            return allowed
+        by_class = allowed[..., [members[0] for members in self._members]]
+        if not np.array_equal(self.to_tile_mask(by_class),
+                              allowed & (self.tile_class >= 0)):
+            raise ValueError("Tiles of a class must be allowed or ruled out together")
+        return by_class
+
+    def _to_class(self, i_tile):
+        """Return the index of the class of the tile with index i_tile."""
+        if self.tile_class is None:
+            return i_tile
+        i_class = self.tile_class[i_tile]
+        if i_class < 0:
+            raise ValueError(f"Tile {self.tile_ids[i_tile]} can never be placed")
+        return i_class
+
+    def _expand(self, i_class):
+        """Choose the tile for a cell fixed to the class i_class."""
+        if self.tile_class is None:
+            return i_class
+        members = self._members[i_class]
+        if len(members) == 1:
+            return members[0]
+        cumulative = np.cumsum(self.compiled.weights[members])
+        chosen = np.searchsorted(cumulative, self.rng.random() * cumulative[-1],
+                                 side='right')
+        return members[min(chosen, len(members) - 1)]
 
-    def __eq__(self, __value) -> bool:
-        return self.id == __value.id
-    
-    def graphics(self):
-        raise NotImplementedError
-    
     @property
-    def graphics_size(self) -> int:
-        raise NotImplementedError
-
-    @abc.abstractmethod
-    def __hash__(self) -> int:
-        return self.id
+    def grid(self) -> _CellView:
+        """The id of the tile each cell is fixed to, None if it is not fixed yet."""
+        return _CellView(self._get_grid_cell, self._set_grid_cell,
+                         self.collapsed.shape)
 
     @property
-    def id(self) -> int:
-        raise NotImplementedError
-
-
-class WaveFuctionCollapse():
-    """The wave function collapse algorithm."""
-
-    def __init__(self, tiles, size):
-        self.tiles = tiles
-        self.tiles_by_id = {tile.id: tile for tile in self.tiles}
-        self._verify_tileset()
-        self.size = size
-        self.grid = [[
-            None for i in range(size[0])]
-            for j in range(size[1])]
-        self.possible_tiles: List[List[Set[int]]] = [[
-            {tile.id for tile in tiles} for i in range(size[0])]
-            for _ in range(size[1])]
-        self.propagated = [[False for i in range(size[0])]
-                           for _ in range(size[1])]
-
-    def _verify_tileset(self):
-        """Verify that the tileset is valid.
-
-        i.e. that all tiles neighours must also have this tile as a neighbour."""
-        for tile in self.tiles:
-            for neig in Neig:
-                for other_tile in tile.neighs[neig]:
-                    if tile.id not in self.tiles_by_id[other_tile
-                                                       ].neighs[OPPOSITE_NEIG[neig]]:
-                        raise ValueError(
-                            f"Invalid tileset: {tile.id} not in " +
-                            f"{self.tiles_by_id[other_tile].neighs[OPPOSITE_NEIG[neig]]}" +
-                            f" of {other_tile}")
+    def possible_tiles(self) -> _CellView:
+        """The ids of the tiles that are still possible for each cell."""
+        return _CellView(self._get_possible_tiles_cell, self._set_possible_tiles_cell,
+                         self.collapsed.shape)
 
     def __str__(self) -> str:
         """Return the current state of the grid as a multi-line string."""
-        out = ''
-        for row in self.grid:
-            for tile in row:
-                if tile is None:
-                    out += '?'
-                else:
-                    out += self.tiles_by_id[tile].visual
-            out += '\n'
-        return out
-
-    def _get_entropies(self):
-        """Return the entropies through the grid.
-
-        This is not a true entropy, but rather the number of possible tiles for each cell.
-        It will be np.inf if the cell is fixed.
-        """
-        entropies = []
-        for ix, row in enumerate(self.possible_tiles):
-            new_row = []
-            for iy, tileset in enumerate(row):
-                if self.grid[ix][iy] is None:
-                    new_row.append(len(tileset))
-                else:
-                    new_row.append(np.inf)
-            entropies.append(new_row)
-        return entropies
+        visuals = [tile.visual for tile in self.tiles]
+        # the layers of 3D grids are separated by empty lines
+        return '\n'.join(''.join(
+            ''.join('?' if i_tile < 0 else visuals[i_tile] for i_tile in row) + '\n'
+            for row in layer) for layer in self.collapsed.reshape(
+                (-1,) + self.collapsed.shape[-2:]))
+
+    def _forget_choices(self):
+        """Make all choices so far final, they are not undone by backtracking."""
+        self._trail.clear()
+        self._decisions.clear()
+        self._decisions_dropped = False
 
     def _is_done(self):
         """Return whether all cells are fixed."""
-        return all(
-            all(len(tileset) == np.inf for tileset in row)
-            for row in self.possible_tiles)
-
-    def _propagate(self, ind):
-        """Propagate the constraints imposed by this fixed tile or its potential tiles
-        to its neighbours."""
-        if self.propagated[ind[0]][ind[1]]:
+        return bool(np.all(self.collapsed >= 0))
+
+    def _collapse(self, cell, i_class, i_tile):
+        """Fix the cell with flat index cell to the tile with index i_tile,
+        whose class has the index i_class."""
+        self.collapsed.flat[cell] = i_tile
+        self._trail.add_fixed(cell)
+        self._mark_dirty(cell)
+        others = np.flatnonzero(self._wave_flat[cell])
+        self._ban(cell, others[others != i_class])
+
+    def _ban(self, cell, i_tiles):
+        """Remove the tiles i_tiles from the possible tiles of a cell.
+
+        The backend is told right away, the consequences for other cells follow
+        with _propagate."""
+        if len(i_tiles) == 0:
             return
-        for neig in Neig:
-            delta_ind = DELTA_IND[neig]
-            ind_neig = tuple(np.add(ind, delta_ind))
-            # print(ind_neig)
-            if (ind_neig[0] < 0 or ind_neig[0] >= self.size[1] or
-                    ind_neig[1] < 0 or ind_neig[1] >= self.size[0]):
-                # this neighbour is outside the grid
-                continue
-            self.possible_tiles[ind_neig[0]][ind_neig[1]] &= \
-                self._get_possible_tiles_for_neig(ind, neig)
-            self.propagated[ind[0]][ind[1]] = True
-            self._propagate(ind_neig)
-
-    def _get_possible_tiles_for_neig(self, ind, neig):
-        """What tiles could be placed at the neighbour in direction neig of the tile at ind?"""
-        own_tile = self.grid[ind[0]][ind[1]]
-        possible_tiles = set()
-        if own_tile is None:
-            # multiple possible tiles
-            for pt in self.possible_tiles[ind[0]][ind[1]]:
-                possible_tiles |= set(self.tiles_by_id[pt].neighs[neig])
+        self._wave_flat[cell, i_tiles] = False
+        self._counts_flat[cell] -= len(i_tiles)
+        self._sum_weights[cell] -= self._weights[i_tiles].sum()
+        self._sum_weight_log_weights[cell] -= self._weight_log_weights[i_tiles].sum()
+        self._update_entropy(cell)
+        if self.stats is not None:
+            self.stats.domain_reductions += len(i_tiles)
+        self._trail.add_bans(cell, i_tiles)
+        self._heuristic.update(cell)
+        self._mark_dirty(cell)
+        self._backend.ban(cell, i_tiles)
+
+    def _restrict(self, cells, allowed):
+        """Ban all tiles that are not allowed from the given cells and propagate once.
+
+        Args:
+            cells (Sequence[int]): Flat indices of the cells.
+            allowed (np.ndarray): Per cell, a boolean mask of the allowed tiles.
+
+        Returns:
+            bool: False if a cell ran out of possible tiles.
+        """
+        for cell, allowed_cell in zip(cells, allowed):
+            self._ban(cell, np.flatnonzero(self._wave_flat[cell] & ~allowed_cell))
+        return bool(np.all(self._counts_flat[cells] > 0)) and self._propagate()
+
+    def constrain(self, constraints) -> None:
+        """Restrict many cells at once, before or between runs of `generate`.
+
+        All constraints are applied first and propagated in one pass. If they
+        can not be satisfied together, none of them is applied.
+
+        Args:
+            constraints (np.ndarray): Either an integer array with the shape of the
+                grid, holding the index of the tile each cell must have or -1 for
+                cells that are free, or a boolean array of shape (*grid, tiles)
+                that holds the allowed tiles per cell. See `tile_index` for the
+                index of a tile.
+
+        Raises:
+            ValueError: If the constraints contradict each other or the grid.
+        """
+        constraints = np.asarray(constraints)
+        self._forget_choices()
+        if constraints.dtype == bool:
+            allowed = self._to_class_mask(constraints.reshape(-1, len(self.tiles)))
+            cells = np.flatnonzero(~allowed.all(axis=1))
+            ok = self._restrict(cells, allowed[cells])
         else:
-            possible_tiles = set(self.tiles_by_id[own_tile].neighs[neig])
-        # delta_ind = DELTA_IND[neig]
-        # ind_neig = tuple(np.add(ind, delta_ind))
-        # print(f"Possible tiles for {ind_neig} in direction {neig} based on {ind}:")
-        # print('>' + ','.join([tile_id for tile_id in possible_tiles]) + '<')
-        return possible_tiles
+            constraints = constraints.ravel()
+            cells = np.flatnonzero(constraints >= 0)
+            classes = np.array([self._to_class(i_tile) for i_tile in constraints[cells]],
+                               dtype=np.intp)
+            ok = bool(self._wave_flat[cells, classes].all())
+            if ok:
+                for cell, i_class in zip(cells, classes):
+                    if self.collapsed.flat[cell] < 0:
+                        self._collapse(cell, i_class, constraints[cell])
+                ok = self._propagate()
+        if not ok:
+            self._clear_queue()
+            self._undo(0)
+            raise ValueError("The constraints can not be satisfied")
+
+    def regenerate(self, region, border=1):
+        """Generate a region of the grid again, leaving the rest as it is.
+
+        The cells of the region and those up to border cells around it are reset
+        to the tiles they had initially that fit their fixed neighbours, and are
+        solved again. Constraints
+        given before for these cells are lost.
 
-    def generate(self, progess_callback=None):
-        """Generate a grid using the wave function collapse algorithm."""
-        i = 0
-        i_max = self.size[0] * self.size[1]
-        while not self._is_done():
-            entropies = np.array(self._get_entropies())
-            # print(entropies)
-
-            min_entropy = np.min(entropies)
-            if min_entropy == np.inf:
-                break
-            print(min_entropy)
-            if min_entropy == 0:
-                raise RuntimeError("Entropy is 0")
+        Args:
+            region (Union[Tuple[slice, ...], np.ndarray]): The cells to reset, as index
+                into `collapsed`, e.g. `np.s_[2:5, 3:8]` or a boolean mask.
+            border (int): How many cells around the region are reset as well, so
+                that the region can fit to its surroundings in more ways.
 
-            potential_positions = np.argwhere(entropies == min_entropy)
-            # print(potential_positions)
-            ind = potential_positions[np.random.randint(
-                len(potential_positions))]
-            print(ind)
+        Returns:
+            _CellView: The whole grid, as returned by `generate`.
+        """
+        self._forget_choices()
+        reset = np.zeros(self.collapsed.shape, dtype=bool)
+        reset[region] = True
+        reset = reset.ravel()
+        for _ in range(border):
+            neighbours = self._neighbours[reset]
+            reset[neighbours[neighbours >= 0]] = True
+        cells = np.flatnonzero(reset)
+        initial = self._get_initial_domains(cells)
+        self._clear_queue()
+        for cell, domain in zip(cells, initial):
+            self.collapsed.flat[cell] = -1
+            self._unban(cell, np.flatnonzero(domain & ~self._wave_flat[cell]))
+            self._mark_dirty(cell)
+        self._backend.check(cells)
+        if not self._propagate():
+            raise RuntimeError("Entropy is 0")
+        self._heuristic.reset(self)
+        return self.generate()
+
+    def _propagate(self):
+        """Propagate the constraints until no tile without support is left.
+
+        Returns False if a cell ran out of possible tiles."""
+        return self._backend.propagate()
+
+    def _clear_queue(self):
+        self._backend.clear()
+
+    def _undo(self, trail_length):
+        """Undo all bans and fixed cells after the first trail_length entries of the trail."""
+        self._clear_queue()
+        while len(self._trail) > trail_length:
+            cell, i_tiles = self._trail.pop(trail_length)
+            if i_tiles is None:
+                self.collapsed.flat[cell] = -1
+            else:
+                self._unban(cell, i_tiles)
+            self._heuristic.update(cell)
+            self._mark_dirty(cell)
+
+    def _unban(self, cell, i_tiles):
+        """Make the tiles i_tiles possible again in a cell, the opposite of _ban."""
+        self._wave_flat[cell, i_tiles] = True
+        self._counts_flat[cell] += len(i_tiles)
+        self._sum_weights[cell] += self._weights[i_tiles].sum()
+        self._sum_weight_log_weights[cell] += self._weight_log_weights[i_tiles].sum()
+        self._update_entropy(cell)
+        self._backend.restore(cell, i_tiles)
+
+    def _backtrack(self):
+        """Recover from a contradiction.
+
+        The last choice is undone and its tile is banned from its cell. If that
+        contradicts as well, the choice before is undone, and so on. When the
+        limits on backtracking are exceeded, all choices are undone instead."""
+        while True:
+            if not self._decisions and not self._decisions_dropped:
+                # all choices have been tried
+                raise RuntimeError("Entropy is 0")
+            if (not self._decisions or
+                    self.backtracks >= self.max_backtracks * (self.restarts + 1)):
+                if self.restarts >= self.max_restarts:
+                    raise RuntimeError(
+                        f"No solution found with {self.restarts} restarts")
+                self.restarts += 1
+                if self.stats is not None:
+                    self.stats.restarts += 1
+                if self.trace is not None:
+                    self.trace('restart')
+                _logger.debug("Starting over")
+                self._undo(0)
+                self._decisions.clear()
+                self._decisions_dropped = False
+                return
+            self.backtracks += 1
+            trail_length, cell, i_class = self._decisions.pop()
+            if self.stats is not None:
+                self.stats.backtracks += 1
+            if self.trace is not None:
+                self.trace('backtrack', cell=cell, tile=self.collapsed.flat[cell])
+            self._undo(trail_length)
+            self._ban(cell, np.array([i_class]))
+            if self._counts_flat[cell] > 0 and self._propagate():
+                return
+            self._clear_queue()
+            self._on_contradiction(cell)
+
+    def _on_contradiction(self, cell):
+        if self.stats is not None:
+            self.stats.contradictions += 1
+        if self.trace is not None:
+            self.trace('contradiction', cell=cell)
+
+    def _choose(self, tileset):
+        """Choose one of the tiles in tileset at random, by their weights."""
+        if self._classes.uniform:
+            return tileset[self.rng.integers(len(tileset))]
+        cumulative = np.cumsum(self._weights[tileset])
+        chosen = np.searchsorted(cumulative, self.rng.random() * cumulative[-1],
+                                 side='right')
+        return tileset[min(chosen, len(tileset) - 1)]
+
+    def iter_steps(self, deadline=None) -> Iterator[Step]:
+        """Generate a grid step by step.
+
+        Each step fixes one cell and propagates the consequences. Nothing is
+        copied or rendered between steps, the grid can be looked at through
+        `collapsed` or `grid` at any time. Stopping the iteration leaves the grid
+        partially generated, a later run continues from there and can still undo
+        the choices made before. Changing the grid in between, e.g. by `constrain`,
+        makes the choices before final.
 
-            tileset = self.possible_tiles[ind[0]][ind[1]]
-            print(','.join(list(tileset)))
-            tile_id = np.random.choice(list(tileset))
-            print(tile_id)
+        Args:
+            deadline (Optional[float]): Time as by `time.monotonic` at which to give
+                up with a `TimeoutError`.
 
-            self.grid[ind[0]][ind[1]] = tile_id
-            self.possible_tiles[ind[0]][ind[1]] = set([tile_id])
-            self._propagate(ind)
-            self.propagated = [[False for i in range(self.size[0])]
-                               for _ in range(self.size[1])]
-            print(str(self) + '\n')
+        Yields:
+            Step: The cell fixed in each step.
+        """
+        self.backtracks = 0
+        self.restarts = 0
+        stats = self.stats
+        while True:
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError("Deadline passed before the grid was generated")
+            if stats is not None:
+                start = time.perf_counter()
+            cell = self._heuristic.pop()
+            if cell is None:
+                if not self._is_done():
+                    raise RuntimeError("The heuristic returned no cell, but not all "
+                                       "cells are fixed")
+                self._forget_choices()
+                return
+            if self._counts_flat[cell] == 0:
+                self._on_contradiction(cell)
+                self._backtrack()
+                continue
+            tileset = np.flatnonzero(self._wave_flat[cell])
+            i_class = self._choose(tileset)
+            i_tile = self._expand(i_class)
+            if stats is not None:
+                stats.selection_time += time.perf_counter() - start
+                stats.collapses += 1
+                start = time.perf_counter()
+            if self.trace is not None:
+                self.trace('collapse', cell=cell, tile=i_tile)
+            if _logger.isEnabledFor(logging.DEBUG):
+                _logger.debug("Fixing cell %s to %s out of %d possible tiles",
+                              np.unravel_index(cell, self.collapsed.shape),
+                              self.tile_ids[i_tile], len(tileset))
+
+            trail_length = len(self._trail)
+            self._decisions.append((trail_length, cell, i_class))
+            if (self.max_backtrack_depth is not None and
+                    len(self._decisions) > self.max_backtrack_depth):
+                del self._decisions[0]
+                self._decisions_dropped = True
+                if self.restarts >= self.max_restarts:
+                    # without restarts left, nothing before the oldest choice is undone
+                    self._trail.drop_before(self._decisions[0][0] if self._decisions
+                                            else trail_length)
+            self._collapse(cell, i_class, i_tile)
+            if self._propagate():
+                step = Step(int(cell), int(i_tile),
+                            len(self._trail.cells_since(trail_length)), False)
+            else:
+                self._on_contradiction(cell)
+                self._backtrack()
+                step = Step(int(cell), int(i_tile), 0, True)
+
+            if stats is not None:
+                stats.propagation_time += time.perf_counter() - start
+            yield step
 
+    def generate(self, progess_callback=None):
+        """Generate a grid using the wave function collapse algorithm."""
+        i_max = self.collapsed.size
+        stats = self.stats
+        for i, _ in enumerate(self.iter_steps()):
             if progess_callback is not None:
+                if stats is not None:
+                    start = time.perf_counter()
                 progess_callback(self, i, i_max)
+                if stats is not None:
+                    stats.callback_time += time.perf_counter() - start
+        return self.grid
+
+    async def generate_async(self, yield_every=64, time_slice=None, deadline=None):
+        """Generate a grid in an asyncio event loop, without blocking it.
 
-            i += 1
-            if i > i_max:
-                raise RuntimeError(f"Max iterations reached ({i_max})")
+        Control is given back to the loop regularly. Cancelling the task stops
+        generating and leaves the grid partially generated.
+
+        Args:
+            yield_every (int): Give back control after this many steps.
+            time_slice (Optional[float]): Also give back control after this many
+                seconds of generating.
+            deadline (Optional[float]): Time as by `time.monotonic` at which to give
+                up with a `TimeoutError`.
+
+        Returns:
+            _CellView: The grid, as returned by `generate`.
+        """
+        steps = self.iter_steps(deadline)
+        try:
+            slice_start = time.monotonic()
+            for i, _ in enumerate(steps, 1):
+                if i % yield_every == 0 or (
+                        time_slice is not None and
+                        time.monotonic() - slice_start >= time_slice):
+                    await asyncio.sleep(0)
+                    slice_start = time.monotonic()
+        finally:
+            steps.close()
         return self.grid
-    
-    def _overlay_all_possible_tiles(self, seed, possible_tiles):
-        """Overlay all possible tiles."""
-        tilesize = self.tiles[0].graphics_size
-        img_np = np.zeros((tilesize, tilesize, 3), dtype=np.float32)
-        n = len(possible_tiles)
-        for tile_id in possible_tiles:
-            tile = self.tiles_by_id[tile_id]
-            tileimg = tile.graphics(seed)
-            img_np += (np.array(tileimg, dtype=np.float32) / n / 255.0)
-        return PIL.Image.fromarray((img_np * 255).astype(np.uint8))
-    
+
+    def pop_dirty_cells(self) -> np.ndarray:
+        """Return the flat indices of the cells that changed since the last call.
+
+        Cells change when tiles are ruled out or when they are fixed."""
+        if self._all_dirty:
+            cells = np.arange(len(self._dirty))
+            self._all_dirty = False
+        else:
+            cells = np.array(self._dirty_cells, dtype=np.intp)
+        self._dirty[:] = False
+        self._dirty_cells.clear()
+        return cells
+
+    def _mark_dirty(self, cell):
+        if not self._dirty[cell]:
+            self._dirty[cell] = True
+            self._dirty_cells.append(cell)
+
     def graphics(self):
-        """Return a PIL image of the grid."""
-        tilesize = self.tiles[0].graphics_size
-        img = PIL.Image.new(
-            'RGB', (self.size[0] * tilesize,
-                    self.size[1] * tilesize))
-        for ix, row in enumerate(self.grid):
-            for iy, tile_id in enumerate(row):
-                seed = ix*len(row)+iy
-                if tile_id is None:
-                    possible_tiles = self.possible_tiles[ix][iy]
-                    tileimg = self._overlay_all_possible_tiles(seed, possible_tiles)
-                else:
-                    tile = self.tiles_by_id[tile_id]
-                    tileimg = tile.graphics(seed)
-                img.paste(
-                    tileimg,
-                    (
-                        iy * tilesize,
-                        ix * tilesize,
-                        (iy + 1) * tilesize,
-                        (ix + 1) * tilesize
-                    )
-                )
-        return img
+        """Return a PIL image of the grid.
+
+        The image is kept between calls and only changed cells are drawn again."""
+        return self.renderer.image()
 
+    @property
+    def renderer(self) -> Renderer:
+        """The renderer used by `graphics`."""
+        if self._renderer is None:
+            self._renderer = Renderer(self)
+        return self._renderer
@@ -0,0 +1,91 @@
+# wavefunctioncollapse
+# Copyright (C) 2023 Christian Henkel
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+
+import numpy as np
+import pytest
+
+from wavefunctioncollapse.animation import FrameSink, writer_sink
+
+
+def test_frame_sink():
+    """Test that frames are written in order, skipping as requested."""
+    written = []
+    closed = []
+    with FrameSink(written.append, lambda: closed.append(True), every=2) as sink:
+        for i in range(7):
+            sink.put(i)
+    assert written == [0, 2, 4, 6]
+    assert closed == [True]
+
+def test_frame_sink_drops_frames():
+    """Test that frames are dropped instead of waiting for a slow writer."""
+    go_on = threading.Event()
+    written = []
+
+    def write_frame(frame):
+        go_on.wait()
+        written.append(frame)
+
+    sink = FrameSink(write_frame, maxsize=2)
+    queued = [sink.put(i) for i in range(10)]
+    go_on.set()
+    sink.close()
+    assert sink.dropped == queued.count(False) > 0
+    assert written == [i for i, ok in enumerate(queued) if ok]
+
+def test_frame_sink_error():
+    """Test that errors of the writer are reported on close."""
+    def write_frame(frame):
+        raise IOError("disk full")
+
+    sink = FrameSink(write_frame, block=True)
+    for i in range(5):
+        sink.put(i)
+    with pytest.raises(RuntimeError):
+        sink.close()
+
+def test_frame_sink_close_error():
+    """Test that errors when closing are reported and the writer is closed after errors."""
+    def close():
+        raise IOError("disk full")
+
+    written = []
+    sink = FrameSink(written.append, close, block=True)
+    sink.put(0)
+    with pytest.raises(RuntimeError):
+        sink.close()
+    assert written == [0]
+
+    closed = []
+    def write_frame(frame):
+        raise IOError("disk full")
+
+    sink = FrameSink(write_frame, lambda: closed.append(True), block=True)
+    sink.put(0)
+    with pytest.raises(RuntimeError):
+        sink.close()
+    assert closed == [True]
+
+def test_writer_sink(tmp_path):
+    """Test writing a gif."""
+    imageio = pytest.importorskip('imageio')
+    path = tmp_path / 'test.gif'
+    with writer_sink(path, block=True) as sink:
+        for i in range(3):
+            sink.put(np.full((4, 5, 3), 50 * i, dtype=np.uint8))
+    assert len(imageio.mimread(path)) == 3
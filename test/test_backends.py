@@ -0,0 +1,72 @@
+# wavefunctioncollapse
+# Copyright (C) 2023 Christian Henkel
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Conformance tests that every backend has to pass."""
+
+import pytest
+
+from wavefunctioncollapse.backends import BACKENDS, NumpyBackend, ReferenceBackend
+from wavefunctioncollapse.topology import Grid2D
+from wavefunctioncollapse.wfc import WaveFuctionCollapse
+
+from test_wfc import (assert_valid_grid,  # pylint: disable=unused-import
+                      tileset_colors, tileset_paths, tileset_valid)
+
+
+@pytest.mark.parametrize('backend', list(BACKENDS))
+@pytest.mark.parametrize('tileset', ['tileset_valid', 'tileset_paths', 'tileset_colors'])
+def test_valid_grids(backend, tileset, request):
+    """Test that the backend gives valid grids, also when backtracking."""
+    tiles = request.getfixturevalue(tileset)
+    for seed in range(3):
+        wfc = WaveFuctionCollapse(tiles, (9, 7), seed=seed, backend=backend)
+        grid = wfc.generate()
+        assert_valid_grid(tiles, grid)
+
+
+@pytest.mark.parametrize('backend', list(BACKENDS))
+def test_contradiction(backend, tileset_valid):
+    """Test that the backend detects when a grid can not be solved."""
+    wfc = WaveFuctionCollapse(tileset_valid, (3, 2), topology=Grid2D(periodic=True),
+                              backend=backend)
+    with pytest.raises(RuntimeError):
+        wfc.generate()
+
+
+def test_same_propagation(tileset_paths):
+    """Test that all backends rule out the same tiles."""
+    waves = []
+    for backend in BACKENDS:
+        wfc = WaveFuctionCollapse(tileset_paths, (6, 5), backend=backend)
+        wfc.possible_tiles[2][3] = {'+'}
+        wfc.possible_tiles[0][0] = {'r', ' '}
+        waves.append(wfc.wave.copy())
+    for wave in waves[1:]:
+        assert (wave == waves[0]).all()
+
+
+def test_select_backend(tileset_valid, monkeypatch):
+    """Test that the backend is chosen by argument or environment variable."""
+    monkeypatch.delenv('WFC_BACKEND', raising=False)
+    wfc = WaveFuctionCollapse(tileset_valid, (2, 2))
+    assert isinstance(wfc._backend, NumpyBackend)  # pylint: disable=protected-access
+    monkeypatch.setenv('WFC_BACKEND', 'reference')
+    wfc = WaveFuctionCollapse(tileset_valid, (2, 2))
+    assert isinstance(wfc._backend, ReferenceBackend)  # pylint: disable=protected-access
+    wfc = WaveFuctionCollapse(tileset_valid, (2, 2), backend=NumpyBackend())
+    assert isinstance(wfc._backend, NumpyBackend)  # pylint: disable=protected-access
+    with pytest.raises(ValueError):
+        WaveFuctionCollapse(tileset_valid, (2, 2), backend='sets')
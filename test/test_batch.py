@@ -0,0 +1,59 @@
+# wavefunctioncollapse
+# Copyright (C) 2023 Christian Henkel
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from wavefunctioncollapse.batch import generate_batch
+from wavefunctioncollapse.wfc import WaveFuctionCollapse
+
+from test_wfc import (MockTile, assert_valid_grid,  # pylint: disable=unused-import
+                      tileset_colors, tileset_paths)
+
+
+def to_ids(tiles, grid):
+    return [[tiles[i_tile].id for i_tile in row] for row in grid]
+
+def test_generate_batch(tileset_paths):
+    """Test that all grids of a batch are valid."""
+    grids, failed = generate_batch(tileset_paths, (16, 9), 20, seeds=0)
+    assert grids.shape == (20, 9, 16)
+    assert not failed.any()
+    for grid in grids:
+        assert_valid_grid(tileset_paths, to_ids(tileset_paths, grid))
+
+def test_generate_batch_seeds(tileset_paths):
+    """Test that a grid only depends on its seed."""
+    grids_1, _ = generate_batch(tileset_paths, (16, 9), 3, seeds=[5, 6, 7])
+    grids_2, _ = generate_batch(tileset_paths, (16, 9), 2, seeds=[6, 9])
+    assert (grids_1[1] == grids_2[0]).all()
+    assert not (grids_1[0] == grids_1[1]).all()
+
+def test_generate_batch_failures(tileset_colors):
+    """Test that contradictions only fail their own grid."""
+    grids, failed = generate_batch(tileset_colors, (20, 20), 50, seeds=2)
+    assert failed.any() and not failed.all()
+    assert (grids[failed] == -1).all()
+    for grid in grids[~failed]:
+        assert_valid_grid(tileset_colors, to_ids(tileset_colors, grid))
+
+def test_generate_batch_edges():
+    """Test that cells at the edges need no neighbours outside, as in the solver."""
+    tiles = [MockTile('x', 'x', neig_lt=['x'], neig_rt=['x']),
+             MockTile('y', 'y', neig_up=['y'], neig_dn=['y'])]
+    expected = WaveFuctionCollapse(tiles, (3, 1)).generate().tolist()
+    assert expected == [['x', 'x', 'x']]
+    grids, failed = generate_batch(tiles, (3, 1), 5, seeds=0)
+    assert not failed.any()
+    for grid in grids:
+        assert to_ids(tiles, grid) == expected
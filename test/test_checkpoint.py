@@ -0,0 +1,76 @@
+# wavefunctioncollapse
+# Copyright (C) 2023 Christian Henkel
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+import pytest
+
+from wavefunctioncollapse.backends import BACKENDS
+from wavefunctioncollapse.checkpoint import load_checkpoint, save_checkpoint
+from wavefunctioncollapse.topology import Grid2D
+from wavefunctioncollapse.wfc import WaveFuctionCollapse
+
+from test_wfc import (assert_valid_grid, tileset_paths,  # pylint: disable=unused-import
+                      tileset_valid)
+
+
+@pytest.mark.parametrize('backend', list(BACKENDS))
+def test_checkpoint(tileset_paths, tmp_path, backend):
+    """Test that a solver continues from a checkpoint."""
+    wfc = WaveFuctionCollapse(tileset_paths, (12, 10), seed=0, backend=backend)
+    pins = np.full(wfc.collapsed.shape, -1)
+    pins[4, :] = wfc.tile_index['-']
+    wfc.constrain(pins)
+    save_checkpoint(wfc, tmp_path / 'checkpoint')
+
+    loaded = load_checkpoint(tmp_path / 'checkpoint', tileset_paths)
+    for name, array in wfc.get_state().items():
+        assert (loaded.get_state()[name] == array).all()
+    assert loaded.rng.random() == wfc.rng.random()
+    grid = loaded.generate()
+    assert_valid_grid(tileset_paths, grid)
+    assert grid[4] == ['-'] * 12
+    # the checkpoint itself is not changed
+    again = load_checkpoint(tmp_path / 'checkpoint', tileset_paths, mmap=False)
+    assert (again.collapsed[4] >= 0).all() and (again.collapsed[5] < 0).all()
+
+
+def test_checkpoint_mismatch(tileset_paths, tileset_valid, tmp_path):
+    """Test that a checkpoint is only loaded with its tileset and topology."""
+    wfc = WaveFuctionCollapse(tileset_paths, (4, 3))
+    save_checkpoint(wfc, tmp_path)
+    with pytest.raises(ValueError):
+        load_checkpoint(tmp_path, tileset_valid)
+    with pytest.raises(ValueError):
+        load_checkpoint(tmp_path, tileset_paths[::-1])
+    with pytest.raises(ValueError):
+        load_checkpoint(tmp_path, tileset_paths, topology=Grid2D(periodic=True))
+
+
+def test_checkpoint_save_in_place(tileset_paths, tmp_path):
+    """Test that a loaded solver is saved back to its own checkpoint."""
+    wfc = WaveFuctionCollapse(tileset_paths, (40, 30), seed=0)
+    save_checkpoint(wfc, tmp_path)
+    loaded = load_checkpoint(tmp_path, tileset_paths)
+    for _, _ in zip(range(50), loaded.iter_steps()):
+        pass
+    save_checkpoint(loaded, tmp_path)
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(
+        [name + '.npy' for name in loaded.get_state()] + ['meta.json'])
+
+    again = load_checkpoint(tmp_path, tileset_paths)
+    for name, array in loaded.get_state().items():
+        assert (again.get_state()[name] == array).all()
+    assert_valid_grid(tileset_paths, again.generate())
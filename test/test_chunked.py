@@ -0,0 +1,52 @@
+# wavefunctioncollapse
+# Copyright (C) 2023 Christian Henkel
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import numpy as np
+
+from wavefunctioncollapse.chunked import ChunkedWorld
+
+from test_wfc import assert_valid_grid, tileset_paths  # pylint: disable=unused-import
+
+
+def assemble(chunks, chunk_size):
+    """Put the streamed chunks together to one grid."""
+    chunks = dict(chunks)
+    rows = max(ix for ix, _ in chunks) + 1
+    cols = max(iy for _, iy in chunks) + 1
+    return np.block([[chunks[(ix, iy)] for iy in range(cols)] for ix in range(rows)])
+
+def test_chunked_world(tileset_paths):
+    """Test that chunks fit together to a valid grid."""
+    world = ChunkedWorld(tileset_paths, (6, 5), seed=4)
+    chunks = list(world.stream(3, 2))
+    assert len(chunks) == 6
+    grid = assemble(chunks, (6, 5))
+    assert grid.shape == (10, 18)
+    assert_valid_grid(tileset_paths, [[tileset_paths[i].id for i in row] for row in grid])
+
+    with ThreadPoolExecutor(2) as executor:
+        chunks_concurrent = list(world.stream(3, 2, executor=executor))
+    assert (assemble(chunks_concurrent, (6, 5)) == grid).all()
+
+def test_chunked_world_endless(tileset_paths):
+    """Test that a world without height keeps on streaming."""
+    world = ChunkedWorld(tileset_paths, (4, 4), seed=5)
+    chunks = list(islice(world.stream(2), 9))
+    assert [ind for ind, _ in chunks] == [
+        (0, 0), (0, 1), (1, 0), (1, 1), (2, 0), (2, 1), (3, 0), (3, 1), (4, 0)]
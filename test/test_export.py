@@ -0,0 +1,58 @@
+# wavefunctioncollapse
+# Copyright (C) 2023 Christian Henkel
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+import PIL.Image
+
+from wavefunctioncollapse.export import to_array, write_ppm, write_text
+from wavefunctioncollapse.wfc import WaveFuctionCollapse
+
+from test_render import tileset_colored  # pylint: disable=unused-import
+from test_wfc import tileset_paths  # pylint: disable=unused-import
+
+
+def test_to_array(tileset_paths, tmp_path):
+    """Test that the grid is exported as compact array, also memory mapped."""
+    wfc = WaveFuctionCollapse(tileset_paths, (7, 5), seed=0)
+    array, ids = to_array(wfc)
+    assert array.dtype == np.uint8 and (array == 255).all()
+    wfc.generate()
+    array, ids = to_array(wfc)
+    assert [[ids[i] for i in row] for row in array] == wfc.grid
+    mapped, _ = to_array(wfc, tmp_path / 'grid.npy')
+    assert isinstance(mapped, np.memmap)
+    assert (np.load(tmp_path / 'grid.npy') == array).all()
+
+
+def test_write_text(tileset_paths, tmp_path):
+    """Test that the text is the same as the string of the solver."""
+    wfc = WaveFuctionCollapse(tileset_paths, (7, 5), seed=0)
+    wfc.possible_tiles[1][2] = {'+'}
+    write_text(wfc, tmp_path / 'grid.txt')
+    assert (tmp_path / 'grid.txt').read_text() == str(wfc)
+    wfc.generate()
+    with open(tmp_path / 'grid.txt', 'w', encoding='utf-8') as f:
+        write_text(wfc, f)
+    assert (tmp_path / 'grid.txt').read_text() == str(wfc)
+
+
+def test_write_ppm(tileset_colored, tmp_path):
+    """Test that the image shows the tiles."""
+    wfc = WaveFuctionCollapse(tileset_colored, (3, 2), seed=0)
+    wfc.generate()
+    write_ppm(wfc, tmp_path / 'grid.ppm')
+    img = np.array(PIL.Image.open(tmp_path / 'grid.ppm'))
+    assert (img == np.array(wfc.graphics())).all()
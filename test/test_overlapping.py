@@ -0,0 +1,67 @@
+# wavefunctioncollapse
+# Copyright (C) 2023 Christian Henkel
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+import pytest
+
+from wavefunctioncollapse.overlapping import extract_patterns, extract_tiles
+from wavefunctioncollapse.wfc import WaveFuctionCollapse
+
+from test_wfc import assert_valid_grid
+
+
+@pytest.fixture()
+def sample():
+    """Squares of 1 with a 2 in their corner on a background of 0."""
+    sample = np.zeros((8, 8), dtype=int)
+    sample[1:4, 1:4] = 1
+    sample[5:7, 4:7] = 1
+    sample[1, 1] = sample[5, 4] = 2
+    return sample
+
+
+def test_extract_patterns(sample):
+    """Test that patterns are counted and their variants added."""
+    patterns, counts, colors = extract_patterns(sample, n=2)
+    assert counts.sum() == sample.size
+    assert len(patterns) == len(np.unique(patterns.reshape(len(patterns), -1), axis=0))
+    assert colors.shape == (3, 3)
+    for pattern, count in zip(patterns, counts):
+        windows = np.lib.stride_tricks.sliding_window_view(
+            np.pad(sample, ((0, 1), (0, 1)), mode='wrap'), (2, 2))
+        assert (windows == pattern).all(axis=(2, 3)).sum() == count
+
+    rotated, _, _ = extract_patterns(sample, n=2, rotations=True)
+    assert len(rotated) > len(patterns)
+    for pattern in patterns:
+        assert (rotated == np.rot90(pattern)).all(axis=(1, 2)).any()
+
+    image = np.array([[0, 255], [255, 255]], dtype=np.uint8)[..., None].repeat(3, axis=2)
+    patterns, counts, colors = extract_patterns(image, n=2, reflections=True)
+    assert (colors == [[0, 0, 0], [255, 255, 255]]).all()
+    assert len(patterns) == 4
+
+
+def test_extract_tiles(sample):
+    """Test that the extracted tileset can be solved and reproduces the patterns."""
+    tiles = extract_tiles(sample, n=3)
+    wfc = WaveFuctionCollapse(tiles, (12, 12), seed=0)
+    grid = wfc.generate()
+    assert_valid_grid(tiles, grid)
+    values = np.array([[wfc.tiles_by_id[tile_id].value for tile_id in row]
+                       for row in grid])
+    assert set(np.unique(values)) <= {0, 1, 2}
+    assert np.array(wfc.graphics()).shape == (12, 12, 3)
@@ -0,0 +1,31 @@
+# wavefunctioncollapse
+# Copyright (C) 2023 Christian Henkel
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from wavefunctioncollapse.parallel import generate_parallel, generate_serial
+
+from test_wfc import tileset_paths  # pylint: disable=unused-import
+
+
+def test_parallel_equals_serial(tileset_paths):
+    """Test that generating in parallel gives the same grids as serially."""
+    parallel = list(generate_parallel(tileset_paths, (8, 6), 6, seeds=3,
+                                      max_workers=2, chunksize=2))
+    serial = list(generate_serial(tileset_paths, (8, 6), 6, seeds=3))
+    assert len(parallel) == 6
+    for grid_parallel, grid_serial in zip(parallel, serial):
+        assert grid_parallel.shape == (6, 8)
+        assert (grid_parallel == grid_serial).all()
+    assert not (serial[0] == serial[1]).all()
@@ -0,0 +1,100 @@
+# wavefunctioncollapse
+# Copyright (C) 2023 Christian Henkel
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+import PIL.Image
+import pytest
+
+from wavefunctioncollapse.render import OverlayCache
+from wavefunctioncollapse.wfc import WaveFuctionCollapse
+
+from test_wfc import MockTile
+
+
+class ColorTile(MockTile):
+    def __init__(self, *args, color=(0, 0, 0)):
+        super().__init__(*args)
+        self.color = color
+        self.calls = 0
+
+    def graphics(self, seed=None):
+        self.calls += 1
+        return PIL.Image.new('RGB', (self.graphics_size,) * 2, self.color)
+
+    @property
+    def graphics_size(self):
+        return 2
+
+@pytest.fixture()
+def tileset_colored():
+    return [
+        ColorTile('a', 'a', ['b'], ['b'], ['b'], ['b'], color=(200, 0, 100)),
+        ColorTile('b', 'b', ['a'], ['a'], ['a'], ['a'], color=(0, 100, 0)),
+    ]
+
+def test_graphics(tileset_colored):
+    """Test that the image shows the possible and fixed tiles."""
+    wfc = WaveFuctionCollapse(tileset_colored, (3, 2))
+    img = np.array(wfc.graphics())
+    assert img.shape == (4, 6, 3)
+    assert (img == [100, 50, 50]).all()
+
+    wfc.generate()
+    img = np.array(wfc.graphics())
+    for ix, row in enumerate(wfc.grid):
+        for iy, tile_id in enumerate(row):
+            color = tileset_colored[wfc.tile_index[tile_id]].color
+            assert (img[2 * ix:2 * ix + 2, 2 * iy:2 * iy + 2] == color).all()
+
+def test_graphics_only_changed_cells():
+    """Test that only changed cells are drawn again, from images drawn once."""
+    tiles = [ColorTile(name, name, *[['a', 'b']] * 4, color=(200 * i, 0, 0))
+             for i, name in enumerate('ab')]
+    wfc = WaveFuctionCollapse(tiles, (10, 10))
+    wfc.graphics()
+    n_variants = wfc.renderer.overlays.n_variants
+    assert [tile.calls for tile in tiles] == [n_variants] * 2
+    drawn = []
+    draw_cell = wfc.renderer._draw_cell  # pylint: disable=protected-access
+    wfc.renderer._draw_cell = lambda cell: drawn.append(cell) or draw_cell(cell)
+    wfc.graphics()
+    assert not drawn
+
+    # no constraints, so only this cell changes
+    wfc.grid[0][0] = 'a'
+    img = np.array(wfc.graphics())
+    assert drawn == [0]
+    assert (img[:2, :2] == tiles[0].color).all()
+    assert [tile.calls for tile in tiles] == [n_variants] * 2
+
+def test_overlay_cache(tileset_colored):
+    """Test that blended images are cached by the possible tiles."""
+    wfc = WaveFuctionCollapse(tileset_colored, (3, 3))
+    overlays = OverlayCache(tileset_colored, n_variants=2, maxsize=2)
+    wfc.renderer.overlays = overlays
+    wfc.graphics()
+    # all cells have the same possible tiles, there is one image per variant
+    assert overlays.misses == 2
+    assert overlays.hits == 7
+
+    mask = np.array([True, False])
+    assert (overlays.get(0, mask) == tileset_colored[0].color).all()
+    assert overlays.misses == 3
+    overlays.get(0, np.array([True, True]))
+    assert overlays.hits == 8
+    # the least recently used image, of variant 1, was dropped
+    overlays.get(2, np.array([True, True]))
+    assert overlays.misses == 4
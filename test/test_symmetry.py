@@ -0,0 +1,75 @@
+# wavefunctioncollapse
+# Copyright (C) 2023 Christian Henkel
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+import PIL.Image
+import pytest
+
+from wavefunctioncollapse.symmetry import (
+    SYMMETRIES, derive_neighbours, get_variants, transform_edges)
+from wavefunctioncollapse.tileset import Neig
+
+from test_wfc import MockTile, tileset_paths  # pylint: disable=unused-import
+
+
+class ImageTile(MockTile):
+    def __init__(self, *args, pixels=None):
+        super().__init__(*args)
+        self.pixels = pixels
+        self.calls = 0
+
+    def graphics(self, seed=None):
+        self.calls += 1
+        return PIL.Image.fromarray(self.pixels)
+
+    @property
+    def graphics_size(self):
+        return len(self.pixels)
+
+
+def test_variants():
+    """Test that variants rotate the edges and the image of the base tile."""
+    assert [len(SYMMETRIES[s]) for s in 'XI\\TLF'] == [1, 2, 2, 4, 4, 8]
+    pixels = np.zeros((3, 3, 3), dtype=np.uint8)
+    pixels[0, 1] = 255  # a mark at the top
+    base = ImageTile('t', 't', pixels=pixels)
+    edges = {Neig.UP: 'x', Neig.DOWN: 'y', Neig.LEFT: 'y', Neig.RIGHT: 'y'}
+    variants = get_variants(base, 'T', edges)
+    assert [tile.id for tile in variants] == ['t0', 't1', 't2', 't3']
+    assert [tile.edges[Neig.RIGHT] for tile in variants] == ['y', 'x', 'y', 'y']
+    image = np.asarray(variants[1].graphics())
+    assert image[1, 2].all() and image.sum() == 3 * 255
+    assert base.calls == 1
+    assert transform_edges({Neig.LEFT: 'a', Neig.RIGHT: 'b'}, 0, True) == {
+        Neig.RIGHT: 'a', Neig.LEFT: 'b'}
+    with pytest.raises(ValueError):
+        get_variants(base, 'T', edges, names=['a'])
+
+
+def test_derive_neighbours(tileset_paths):
+    """Test that the paths tileset follows from a crossing, a line and a corner."""
+    def variants(name, symmetry, paths, names):
+        edges = {neig: neig in paths for neig in Neig}
+        return get_variants(MockTile(name, name), symmetry, edges, names, names)
+
+    tiles = derive_neighbours(
+        variants('+', 'X', tuple(Neig), ['+']) + variants(' ', 'X', (), [' ']) +
+        variants('|', 'I', (Neig.UP, Neig.DOWN), ['|', '-']) +
+        variants('r', 'L', (Neig.DOWN, Neig.RIGHT), ['r', '7', 'J', 'L']))
+    expected = {tile.id: tile.neighs for tile in tileset_paths}
+    for tile in tiles:
+        for neig in Neig:
+            assert sorted(tile.neighs[neig]) == sorted(expected[tile.id][neig])
@@ -0,0 +1,77 @@
+# wavefunctioncollapse
+# Copyright (C) 2023 Christian Henkel
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+import pytest
+
+from wavefunctioncollapse.topology import Grid2D, Grid3D, HexGrid
+from wavefunctioncollapse.wfc import WaveFuctionCollapse
+
+from test_wfc import MockTile, tileset_paths  # pylint: disable=unused-import
+
+
+def assert_valid_neighbours(wfc):
+    """Assert that all neighbouring tiles are allowed next to each other."""
+    collapsed = wfc.collapsed.ravel()
+    assert (collapsed >= 0).all()
+    for i_neig, neig in enumerate(wfc.topology.directions):
+        neighbours = wfc.topology.neighbours(wfc.collapsed.shape)[:, i_neig]
+        for cell in np.flatnonzero(neighbours >= 0):
+            tile = wfc.tiles[collapsed[cell]]
+            assert wfc.tile_ids[collapsed[neighbours[cell]]] in tile.neighs[neig]
+
+
+def test_neighbour_tables():
+    """Test the neighbours of cells at the edges of grids."""
+    table = Grid2D(periodic=True).neighbours((2, 3))
+    assert table[0].tolist() == [3, 3, 2, 1]
+    assert not table.flags.writeable
+    assert table is Grid2D(periodic=True).neighbours((2, 3))
+
+    table = Grid3D().neighbours((2, 1, 3))
+    assert table[1].tolist() == [-1, -1, 0, 2, 4, -1]
+
+    table = HexGrid().neighbours((3, 3))
+    assert table[4].tolist() == [1, 2, 3, 5, 7, 8]
+    assert table[3].tolist() == [0, 1, -1, 4, 6, 7]
+    assert table[0].tolist() == [-1, -1, -1, 1, -1, 3]
+    with pytest.raises(ValueError):
+        HexGrid(periodic=True).neighbours((3, 2))
+
+
+def test_periodic(tileset_paths):
+    """Test that tiles on opposite edges of a periodic grid fit together."""
+    wfc = WaveFuctionCollapse(tileset_paths, (8, 6), topology=Grid2D(periodic=True),
+                              seed=0)
+    wfc.generate()
+    assert_valid_neighbours(wfc)
+    assert (wfc.topology.neighbours(wfc.collapsed.shape) >= 0).all()
+
+
+@pytest.mark.parametrize('topology', [Grid3D(), HexGrid(), HexGrid(periodic=True)])
+def test_topologies(topology):
+    """Test that grids of cubes and hexagons are solved."""
+    # neighbouring cells have different colors
+    colors = ['r', 'g', 'b']
+    tiles = [MockTile(color, color, neighs={
+        neig: [other for other in colors if other != color]
+        for neig in topology.directions}) for color in colors]
+    size = (4, 4, 3) if isinstance(topology, Grid3D) else (6, 4)
+    wfc = WaveFuctionCollapse(tiles, size, topology=topology, seed=0)
+    wfc.generate()
+    assert wfc.collapsed.shape == tuple(reversed(size))
+    assert_valid_neighbours(wfc)
+    assert '?' not in str(wfc)
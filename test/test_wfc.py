@@ -14,9 +14,15 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
+
+import numpy as np
 import pytest
 
-from wavefunctioncollapse.wfc import Tile, WaveFuctionCollapse
+from wavefunctioncollapse.wfc import Tile, WaveFuctionCollapse, Neig, DELTA_IND
+from wavefunctioncollapse.tileset import compile_tileset
+from wavefunctioncollapse.topology import Grid2D
+from wavefunctioncollapse import wfc as wfc_module
 
 
 class MockTile(Tile):
@@ -35,6 +41,45 @@ def tileset_valid():
         MockTile('b', 'b', ['a'], ['a'], ['a'], ['a'])
     ]
 
+@pytest.fixture()
+def tileset_paths():
+    """The tileset of paths and crossings from the paths demo."""
+    return [
+        MockTile('+', '┼', ['+', '|', 'r', '7'], ['+', '|', 'J', 'L'],
+                 ['+', '-', 'r', 'L'], ['+', '-', '7', 'J']),
+        MockTile('-', '─', [' ', '-', 'J', 'L'], [' ', '-', 'r', '7'],
+                 ['+', '-', 'r', 'L'], ['+', '-', '7', 'J']),
+        MockTile('|', '│', ['+', '|', 'r', '7'], ['+', '|', 'J', 'L'],
+                 [' ', '|', 'J', '7'], [' ', '|', 'r', 'L']),
+        MockTile(' ', ' ', [' ', '-', 'J', 'L'], [' ', '-', 'r', '7'],
+                 [' ', '|', 'J', '7'], [' ', '|', 'r', 'L']),
+        MockTile('r', '┌', [' ', '-', 'J', 'L'], ['|', 'J', '+', 'L'],
+                 [' ', '|', 'J', '7'], ['-', 'J', '+', '7']),
+        MockTile('7', '┐', [' ', '-', 'J', 'L'], ['|', 'J', '+', 'L'],
+                 ['-', 'r', '+', 'L'], [' ', '|', 'r', 'L']),
+        MockTile('J', '┘', ['|', 'r', '+', '7'], [' ', '-', 'r', '7'],
+                 ['-', 'r', '+', 'L'], [' ', '|', 'r', 'L']),
+        MockTile('L', '└', ['|', 'r', '+', '7'], [' ', '-', 'r', '7'],
+                 [' ', '|', 'J', '7'], ['-', '7', '+', 'J']),
+    ]
+
+def assert_valid_grid(tiles, grid):
+    """Assert that all neighbouring tiles in grid are allowed by the tileset."""
+    tiles_by_id = {tile.id: tile for tile in tiles}
+    for ix, row in enumerate(grid):
+        for iy, tile_id in enumerate(row):
+            assert tile_id is not None
+            for neig in Neig:
+                jx, jy = ix + DELTA_IND[neig][0], iy + DELTA_IND[neig][1]
+                if 0 <= jx < len(grid) and 0 <= jy < len(row):
+                    assert grid[jx][jy] in tiles_by_id[tile_id].neighs[neig]
+
+@pytest.fixture()
+def tileset_colors():
+    """Three colors, neighbouring cells must have different colors."""
+    colors = 'abc'
+    return [MockTile(c, c, *[[o for o in colors if o != c]] * 4) for c in colors]
+
 @pytest.fixture()
 def tileset_invalid():
     """A simple invalid tileset."""
@@ -54,6 +99,25 @@ def test_tileset_invalid(tileset_invalid):
         wfc = WaveFuctionCollapse(tileset_invalid, (2, 2))
         wfc.generate()
     
+def test_tileset_unknown_neighbour(tileset_valid):
+    """Test that a tileset referring to an unknown tile is invalid."""
+    tileset_valid[0].neighs[Neig.UP] = ['b', 'c']
+    with pytest.raises(ValueError):
+        compile_tileset(tileset_valid)
+
+def test_tileset_compiled_once(tileset_valid, tileset_paths):
+    """Test that solvers with the same tileset share the compiled rules."""
+    wfc_1 = WaveFuctionCollapse(tileset_valid, (2, 2))
+    wfc_2 = WaveFuctionCollapse([
+        MockTile('a', 'a', ['b'], ['b'], ['b'], ['b']),
+        MockTile('b', 'b', ['a'], ['a'], ['a'], ['a'])
+    ], (3, 3))
+    assert wfc_1.compiled is wfc_2.compiled
+    assert compile_tileset(tileset_paths) is not wfc_1.compiled
+    compatible = wfc_1.compiled.compatible
+    assert compatible.shape == (len(Neig), 2, 2)
+    assert compatible[:, 0, 1].all() and not compatible[:, 0, 0].any()
+
 def test_generation(tileset_valid):
     """Test if the generation works."""
     wfc = WaveFuctionCollapse(tileset_valid, (2, 2))
@@ -74,4 +138,298 @@ def test_generation(tileset_valid):
         assert grid[0][1] == 'a'
         assert grid[1][0] == 'a'
         assert grid[1][1] == 'b'
-        assert str(wfc) == 'ba\nab\n'
\ No newline at end of file
+        assert str(wfc) == 'ba\nab\n'
+
+def test_state_views(tileset_valid):
+    """Test that grid and possible_tiles behave like nested lists."""
+    wfc = WaveFuctionCollapse(tileset_valid, (3, 2))
+    assert len(wfc.grid) == 2
+    assert len(wfc.grid[0]) == 3
+    assert wfc.grid[1][2] is None
+    assert wfc.possible_tiles[1][2] == {'a', 'b'}
+    assert str(wfc) == '???\n???\n'
+
+    wfc.possible_tiles[0][1] = {'b'}
+    assert wfc.possible_tiles[0][1] == {'b'}
+    wfc.grid[0][0] = 'a'
+    assert wfc.grid[0][0] == 'a'
+    assert wfc.possible_tiles[0][0] == {'a'}
+    assert str(wfc) == 'a??\n???\n'
+
+
+def test_large_grid(tileset_paths):
+    """Test that propagation over a larger grid neither recurses nor breaks rules."""
+    wfc = WaveFuctionCollapse(tileset_paths, (60, 40))
+    grid = wfc.generate()
+    assert_valid_grid(tileset_paths, grid)
+
+
+@pytest.mark.parametrize('heuristic', ['count', 'entropy', 'scanline'])
+def test_heuristics(tileset_paths, heuristic):
+    """Test that all heuristics produce valid grids."""
+    wfc = WaveFuctionCollapse(tileset_paths, (12, 9), heuristic=heuristic)
+    grid = wfc.generate()
+    assert_valid_grid(tileset_paths, grid)
+
+
+def test_min_count_heuristic(tileset_paths):
+    """Test that the cell with the fewest tiles is chosen, also when it is unchanged
+    since the heuristic was reset."""
+    wfc = WaveFuctionCollapse(tileset_paths, (12, 9), seed=0)
+    wfc.possible_tiles[4][5] = {'+', '-', '|'}
+    wfc.possible_tiles[2][3] = {'+', '-'}
+    assert wfc._heuristic.pop() == 2 * 12 + 3  # pylint: disable=protected-access
+    wfc._heuristic.reset(wfc)  # pylint: disable=protected-access
+    assert wfc._heuristic.pop() == 2 * 12 + 3  # pylint: disable=protected-access
+
+
+def test_backtracking(tileset_colors):
+    """Test that contradictions are resolved by backtracking."""
+    wfc = WaveFuctionCollapse(tileset_colors, (20, 20), seed=2)
+    grid = wfc.generate()
+    assert_valid_grid(tileset_colors, grid)
+    assert wfc.backtracks > 0
+
+    wfc = WaveFuctionCollapse(tileset_colors, (20, 20), seed=2,
+                              max_backtracks=0, max_restarts=0)
+    with pytest.raises(RuntimeError):
+        wfc.generate()
+
+    # without restarts, the trail before the oldest undoable choice is dropped
+    wfc = WaveFuctionCollapse(tileset_colors, (20, 20), seed=0,
+                              max_backtrack_depth=5, max_restarts=0)
+    steps = wfc.iter_steps()
+    for _ in range(200):
+        next(steps)
+    assert len(wfc._trail) - wfc._trail._end > 0  # pylint: disable=protected-access
+    for _ in steps:
+        pass
+    assert_valid_grid(tileset_colors, wfc.grid)
+
+    # undone cells are behind the cursor of the scanline heuristic
+    for seed in range(10):
+        wfc = WaveFuctionCollapse(tileset_colors, (9, 9), heuristic='scanline',
+                                  topology=Grid2D(periodic=True), seed=seed)
+        wfc.generate()
+        assert (wfc.collapsed >= 0).all()
+
+def test_weights(tileset_paths):
+    """Test that entropies are kept up to date and tiles are chosen by weight."""
+    for tile in tileset_paths:
+        tile.weight = 50.0 if tile.id == ' ' else 1.0
+    wfc = WaveFuctionCollapse(tileset_paths, (10, 10), heuristic='entropy', seed=1)
+    wfc.possible_tiles[0][0] = {' ', '+'}
+    p = np.array([50.0, 1.0]) / 51.0
+    assert wfc.entropies[0] == pytest.approx(-np.sum(p * np.log(p)))
+    grid = wfc.generate()
+    assert_valid_grid(tileset_paths, grid)
+    assert sum(row.count(' ') for row in grid.tolist()) > 50
+
+    tileset_paths[0].weight = 0
+    with pytest.raises(ValueError):
+        WaveFuctionCollapse(tileset_paths, (2, 2))
+
+
+def test_minimize():
+    """Test that interchangeable tiles are merged and unplaceable tiles dropped."""
+    tiles = [MockTile(c, c, *[['b', 'B'] if c in 'aA' else ['a', 'A']] * 4)
+             for c in 'aAbB']
+    tiles.append(MockTile('x', 'x', ['x'], ['x'], [], []))
+    wfc = WaveFuctionCollapse(tiles, (4, 4), topology=Grid2D(periodic=True),
+                              minimize=True, seed=0)
+    assert wfc.wave.shape == (4, 4, 2)
+    assert wfc.tile_class.tolist() == [0, 0, 1, 1, -1]
+    assert wfc.possible_tiles[0][0] == {'a', 'A', 'b', 'B'}
+    with pytest.raises(ValueError):
+        wfc.possible_tiles[0][0] = {'a', 'b'}
+    grid = wfc.generate()
+    assert_valid_grid(tiles, grid)
+    assert {tile_id for row in grid for tile_id in row} == {'a', 'A', 'b', 'B'}
+    pins = np.full(wfc.collapsed.shape, -1)
+    pins[0, 0] = wfc.tile_index['x']
+    with pytest.raises(ValueError):
+        wfc.constrain(pins)
+    # without wrapping around, x fits at the left and right edges
+    wfc = WaveFuctionCollapse(tiles, (4, 4), minimize=True)
+    assert wfc.wave.shape == (4, 4, 3)
+
+
+def test_constrain(tileset_paths):
+    """Test that cells can be pinned and restricted in bulk."""
+    wfc = WaveFuctionCollapse(tileset_paths, (8, 6), seed=0)
+    pins = np.full(wfc.collapsed.shape, -1)
+    pins[2, :] = wfc.tile_index['-']
+    wfc.constrain(pins)
+    allowed = np.ones(wfc.wave.shape, dtype=bool)
+    allowed[0, 0] = False
+    allowed[0, 0, wfc.tile_index['r']] = True
+    wfc.constrain(allowed)
+    grid = wfc.generate()
+    assert_valid_grid(tileset_paths, grid)
+    assert grid[2] == ['-'] * 8
+    assert grid[0][0] == 'r'
+
+    wfc = WaveFuctionCollapse(tileset_paths, (8, 6), seed=0)
+    pins = np.full(wfc.collapsed.shape, -1)
+    pins[2, 2:4] = [wfc.tile_index['-'], wfc.tile_index['|']]
+    with pytest.raises(ValueError):
+        wfc.constrain(pins)
+    assert (wfc.counts == len(tileset_paths)).all()
+
+
+def test_regenerate(tileset_paths):
+    """Test that only the region and its border are generated again."""
+    wfc = WaveFuctionCollapse(tileset_paths, (10, 8), seed=0)
+    wfc.generate()
+    before = wfc.collapsed.copy()
+    changed = False
+    for _ in range(5):
+        grid = wfc.regenerate(np.s_[3:5, 4:7])
+        assert_valid_grid(tileset_paths, grid)
+        outside = np.ones(before.shape, dtype=bool)
+        outside[2:6, 3:8] = False
+        assert (wfc.collapsed[outside] == before[outside]).all()
+        changed |= (wfc.collapsed != before).any()
+    assert changed
+
+
+def test_iter_steps(tileset_paths):
+    """Test that steps can be iterated, stopped and continued."""
+    wfc = WaveFuctionCollapse(tileset_paths, (6, 5), seed=0)
+    steps = wfc.iter_steps()
+    first = next(steps)
+    assert wfc.collapsed.flat[first.cell] == first.tile
+    assert first.changed >= 1 and not first.backtracked
+    steps.close()
+    assert (wfc.collapsed < 0).sum() == 29
+    assert_valid_grid(tileset_paths, wfc.generate())
+    with pytest.raises(TimeoutError):
+        list(WaveFuctionCollapse(tileset_paths, (6, 5)).iter_steps(deadline=0))
+
+
+def test_resume_backtracking(tileset_colors):
+    """Test that a resumed run can undo choices made before the pause."""
+    for seed in (13, 16, 34):
+        wfc = WaveFuctionCollapse(tileset_colors, (9, 9), seed=seed,
+                                  topology=Grid2D(periodic=True))
+        steps = wfc.iter_steps()
+        for _ in range(60):
+            next(steps)
+        steps.close()
+        wfc.generate()
+        assert (wfc.collapsed >= 0).all()
+
+
+def test_generate_async(tileset_paths):
+    """Test that generating gives back control to the event loop and can be cancelled."""
+    async def run():
+        wfc = WaveFuctionCollapse(tileset_paths, (20, 20), seed=0)
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0)
+
+        ticker = asyncio.ensure_future(tick())
+        grid = await wfc.generate_async(yield_every=10)
+        assert ticks >= 400 // 10
+        assert_valid_grid(tileset_paths, grid)
+
+        wfc = WaveFuctionCollapse(tileset_paths, (20, 20), seed=0)
+        task = asyncio.ensure_future(wfc.generate_async(yield_every=1))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert 0 < (wfc.collapsed >= 0).sum() < 400
+        ticker.cancel()
+
+    asyncio.run(run())
+
+
+def test_no_solution(tileset_valid):
+    """Test that an unsolvable grid raises an error."""
+    with pytest.raises(ValueError):
+        WaveFuctionCollapse([MockTile('a', 'a', ['a'], ['a'], [], [])], (2, 2))
+    # every tile has a fitting neighbour, but a row of three can not alternate
+    wfc = WaveFuctionCollapse(tileset_valid, (3, 2), topology=Grid2D(periodic=True))
+    with pytest.raises(RuntimeError):
+        wfc.generate()
+
+
+def test_boundary(tileset_paths, tileset_valid):
+    """Test that the boundary constrains the cells at the edges."""
+    wfc = WaveFuctionCollapse(tileset_paths, (7, 5), boundary=' ', seed=0)
+    assert not wfc.wave[0, :, wfc.tile_index['|']].any()
+    again = WaveFuctionCollapse(tileset_paths, (7, 5), boundary=' ', seed=0)
+    assert (again.wave == wfc.wave).all() and again.wave is not wfc.wave
+    grid = wfc.generate()
+    assert_valid_grid(tileset_paths, grid)
+    for row in (grid[0], grid[-1]):
+        assert not {'|', '+'} & set(row)
+    for tile_id in ('-', '+'):
+        assert tile_id not in {row[0] for row in grid} | {row[-1] for row in grid}
+    wfc.regenerate(np.s_[0:2, 0:3])
+    assert_valid_grid(tileset_paths, wfc.grid)
+    assert not {'|', '+'} & set(wfc.grid[0])
+    with pytest.raises(ValueError):
+        # all cells are at the edge and must be b, next to each other
+        WaveFuctionCollapse(tileset_valid, (2, 2), boundary='a')
+
+
+def test_initial_state_cache(tileset_paths, monkeypatch):
+    """Test that the cached initial states stay within their memory limit."""
+    monkeypatch.setattr(wfc_module, '_INITIAL_STATES_MAXBYTES', 2000)
+    monkeypatch.setattr(wfc_module, '_initial_states', wfc_module.OrderedDict())
+    WaveFuctionCollapse(tileset_paths, (10, 10), backend='numpy')
+    # the support counts do not fit, the wave is kept for regenerate only
+    (arrays, complete), = wfc_module._initial_states.values()  # pylint: disable=protected-access
+    assert list(arrays) == ['wave'] and not complete
+    # not even the wave fits
+    wfc = WaveFuctionCollapse(tileset_paths, (20, 20), backend='numpy', seed=0)
+    assert len(wfc_module._initial_states) == 1  # pylint: disable=protected-access
+    initial = wfc.wave.copy()
+    wfc.generate()
+    # regenerate uses the initial wave the solver kept instead of propagating again
+    monkeypatch.setattr(wfc_module.WaveFuctionCollapse, '_init_state', None)
+    assert (wfc._get_initial_domains(np.arange(400)) ==  # pylint: disable=protected-access
+            initial.reshape(400, -1)).all()
+    assert_valid_grid(tileset_paths, wfc.regenerate(np.s_[3:6, 3:6]))
+
+
+def test_seed(tileset_paths):
+    """Test that the same seed gives the same grid."""
+    grids = []
+    for seed in [1, 1, 2]:
+        wfc = WaveFuctionCollapse(tileset_paths, (10, 8), seed=seed)
+        grids.append(wfc.generate().tolist())
+    assert grids[0] == grids[1]
+    assert grids[0] != grids[2]
+
+    # the same with and without the initial state in the cache
+    grids = []
+    for _ in range(2):
+        wfc_module._initial_states.clear()  # pylint: disable=protected-access
+        for _ in range(2):
+            wfc = WaveFuctionCollapse(tileset_paths, (10, 8), seed=3, boundary=' ')
+            grids.append(wfc.generate().tolist())
+    assert all(grid == grids[0] for grid in grids)
+
+def test_stats(tileset_colors, capsys):
+    """Test that the statistics are collected and nothing is printed."""
+    events = []
+    wfc = WaveFuctionCollapse(tileset_colors, (20, 20), seed=2, stats=True,
+                              trace=lambda event, **data: events.append(event))
+    wfc.generate(lambda *_: None)
+    assert capsys.readouterr().out == ''
+    stats = wfc.stats
+    assert stats.collapses == events.count('collapse') > 0
+    assert stats.backtracks == wfc.backtracks == events.count('backtrack') > 0
+    assert stats.contradictions == events.count('contradiction') > 0
+    assert stats.propagation_visits > 0
+    assert stats.domain_reductions >= 20 * 20 * 2
+    assert stats.selection_time > 0 and stats.propagation_time > 0
+    assert stats.callback_time > 0
+    assert WaveFuctionCollapse(tileset_colors, (2, 2)).stats is None